@@ -4,6 +4,17 @@ __author__ = """Valmiki Rao"""
 __email__ = 'valmikirao@gmail.com'
 __version__ = '0.1.5'
 
-from .aws_cloudwatch_insights import Insights
+from typing import Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .aws_cloudwatch_insights import Insights
 
 __all__ = ['Insights']
+
+
+def __getattr__(name: str) -> Any:
+    # imported on first use, since it pulls in boto3 and numpy, which the cli doesn't need when talking to the daemon
+    if name == 'Insights':
+        from .aws_cloudwatch_insights import Insights
+        return Insights
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
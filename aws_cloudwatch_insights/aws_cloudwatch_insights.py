@@ -1,12 +1,30 @@
 """Main module."""
 import json
+import os
+import re
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import partial
 from json import JSONDecodeError
-from typing import List, Optional, Dict, Any, Callable, Iterable, Union
+from typing import List, Optional, Dict, Any, Callable, Iterable, Union, Tuple, cast
 
-import boto3
 from botocore.exceptions import ClientError
 
+from .clients import get_logs_client
+from .json_cache import JsonCache
+from .merge import ExternalMerger
+from .parallel import OrderedProcessPipeline
+from .partial import PartialReason, PartialResults, PartialIterator
+from .sweep import SweepMode, SweepTemplateException, template_placeholder, packed_field, pack_bindings, render, \
+    render_packed, find_binding, MAX_RESULT_LIMIT
+from .hooks import InsightsHooks, PostProcessStage, THROTTLING_ERROR_CODES
+from .cost import ScanEstimator, ScanBudgetExceededException
+from .checkpoint import CheckpointManifest, ExportWindow, TruncatedWindowWarning, load_manifest, save_manifest
+from .dataframe import DataFrameLibrary, build_dataframe
+from .typed import Schema, decode_typed_results
+
 try:
     from mypy_boto3_logs import CloudWatchLogsClient
     from mypy_boto3_logs.type_defs import GetQueryResultsResponseTypeDef, ResultFieldTypeDef
@@ -69,19 +87,38 @@ class TestingClient:
 """
 
 
+_SORTED_QUERY_RE = re.compile(r'(^|\|)\s*(sort|stats)\b', flags=re.IGNORECASE | re.MULTILINE)
+
+
+def _is_sorted_query(query: str) -> bool:
+    """Partial results of queries that sort or aggregate can change completely before the query completes"""
+    return bool(_SORTED_QUERY_RE.search(query))
+
+
+def _deadline_seconds(deadline: Union[float, timedelta, datetime]) -> float:
+    if isinstance(deadline, datetime):
+        return (deadline - datetime.now(deadline.tzinfo)).total_seconds()
+    elif isinstance(deadline, timedelta):
+        return deadline.total_seconds()
+    else:
+        return float(deadline)
+
+
 class InsightsRemoteException(Exception):
     def __init__(self, status):
-        super(f"AWS Returned Invalid Status: {status!r}")
+        super().__init__(f"AWS Returned Invalid Status: {status!r}")
         self.status = status
 
 
-def jsonify_insights_results(results: Iterable[GenericDict]) -> Iterable[GenericDict]:
+def jsonify_insights_results(results: Iterable[GenericDict],
+                             json_cache: Optional[JsonCache] = None) -> Iterable[GenericDict]:
+    loads = json_cache.loads if json_cache is not None else json.loads
     for row in results:
         returned_row = {}
         for key, value in row.items():
             if isinstance(value, str) and value.startswith('{'):
                 try:
-                    parsed_value = json.loads(value)
+                    parsed_value = loads(value)
                     returned_row[key] = parsed_value
                 except JSONDecodeError:
                     returned_row[key] = value
@@ -91,27 +128,96 @@ def jsonify_insights_results(results: Iterable[GenericDict]) -> Iterable[Generic
         yield returned_row
 
 
+def _normalize_time(time: Union[int, datetime, timedelta]) -> int:
+    if isinstance(time, int):
+        return time
+    elif isinstance(time, datetime):
+        return int(time.timestamp())
+    elif isinstance(time, timedelta):
+        return int((datetime.now() + time).timestamp())
+    else:
+        raise NotImplementedError()
+
+
 def dictify_results(results: Iterable[Iterable[ResultFieldTypeDef]]) -> Iterable[GenericDict]:
     for row in results:
         returned_row = {i['field']: i['value'] for i in row}
         yield returned_row
 
 
+# each worker process has its own cache for memoize_json
+_worker_json_cache: Optional[JsonCache] = None
+
+
+def _encode_jsonl(results_raw: List[List[ResultFieldTypeDef]], jsonify: bool, typed: Union[bool, Schema],
+                  memoize_json: bool) -> Tuple[bytes, int]:
+    """
+    Post-processes raw results the way get_insights() does and encodes them as jsonl, returning the bytes and the row
+    count.  Run in the worker processes of export_insights(processes=...), so only bytes are sent back to the parent
+    """
+    global _worker_json_cache
+    results = dictify_results(results_raw)
+    if jsonify:
+        if memoize_json and _worker_json_cache is None:
+            _worker_json_cache = JsonCache()
+        results = jsonify_insights_results(results, _worker_json_cache if memoize_json else None)
+    if typed:
+        results = decode_typed_results(results, schema=typed if isinstance(typed, dict) else None)
+    return _encode_rows(results)
+
+
+def _encode_rows(results: Iterable[GenericDict]) -> Tuple[bytes, int]:
+    lines = [json.dumps(row, default=str) + "\n" for row in results]
+    return ''.join(lines).encode(), len(lines)
+
+
 class Insights:
-    def __init__(self, logs_client: Optional[CloudWatchLogsClient] = None):
+    def __init__(self, logs_client: Optional[CloudWatchLogsClient] = None, hooks: Optional[InsightsHooks] = None):
         """
-        Object for querying AWS Cloudwatch.  Optionally takes a boto3 client as an argument, otherwise creates its own
+        Object for querying AWS Cloudwatch.  Optionally takes a boto3 client as an argument, otherwise uses a logs
+        client shared with every other Insights instance (see clients.ClientRegistry).
+
+        hooks: If included, an InsightsHooks instance which is told about each query's lifecycle: started, polled,
+          throttled, completed or cancelled, and how long each post-processing stage took
         """
         if logs_client:
             self.logs_client = logs_client
         else:
-            self.logs_client = boto3.client('logs')
+            self.logs_client = get_logs_client()
+        self.hooks = hooks
+        self._scan_estimator: Optional[ScanEstimator] = None
+        self._json_cache: Optional[JsonCache] = None
+
+    @property
+    def json_cache(self) -> JsonCache:
+        """The cache used by get_insights(memoize_json=True), shared by all the queries run by this instance"""
+        if self._json_cache is None:
+            self._json_cache = JsonCache()
+        return self._json_cache
+
+    @property
+    def scan_estimator(self) -> ScanEstimator:
+        if self._scan_estimator is None:
+            self._scan_estimator = ScanEstimator(self.logs_client)
+        return self._scan_estimator
+
+    def estimate_scan_bytes(self, group_names: List[str], start_time: Union[int, datetime, timedelta],
+                            end_time: Union[int, datetime, timedelta, None] = None) -> int:
+        """
+        A rough estimate of the bytes a query over these groups and times would scan, from the groups' stored bytes
+        and retention.  Doesn't run a query
+        """
+        end_time = end_time if end_time is not None else datetime.now()
+        return self.scan_estimator.estimate_bytes(group_names, _normalize_time(start_time), _normalize_time(end_time))
 
     def get_insights(self, query: str, result_limit: int, group_names: List[str],
                      start_time: Union[int, datetime, timedelta],
                      end_time: Union[int, datetime, timedelta, None] = None,
                      callback: Optional[CallbackFunction] = None, error: Optional[ErrorFunction] = None,
-                     jsonify: bool = True) -> Iterable[GenericDict]:
+                     jsonify: bool = True, typed: Union[bool, Schema] = False, max_bytes: Optional[int] = None,
+                     narrow: bool = False, deadline: Union[float, timedelta, datetime, None] = None,
+                     stop_at_limit: bool = False,
+                     memoize_json: Union[bool, JsonCache] = False) -> Iterable[GenericDict]:
         """
         Gets elements from AWS Cloudwatch Logs using an Insights query:
 
@@ -131,53 +237,292 @@ class Insights:
           list if that value is None
         jsonify: If set to True, attempts to parse suspected json objects.  If parsing fails, just returns the string.
           Default: True
+        typed: If set to True, converts `@timestamp` and `@ingestionTime` to int epoch milliseconds and fields that
+          look numeric to ints or floats.  Values with leading zeros, like '012345678901', are left as strings.  Can
+          also be a dict of field name to type ('timestamp', 'datetime', 'int', 'float' or 'str'), in which case only
+          those fields are converted.  Conversion is done a column at a time, using numpy if it's installed.
+          Default: False
+        max_bytes: If included, a budget for the bytes scanned.  Before the query starts, the bytes it would scan are
+          estimated with estimate_scan_bytes(), and if the estimate is over budget a ScanBudgetExceededException is
+          raised (or passed to `error`).  While the query runs, it's stopped as soon as the bytes AWS reports it has
+          scanned go over budget, also raising ScanBudgetExceededException.  A query that has already completed is
+          returned whatever it scanned, since it's been billed by then.  Default: None
+        narrow: If set to True along with `max_bytes`, instead of refusing a query which is estimated to be over
+          budget, moves its start time later until the estimate is within budget.  Default: False
+        deadline: If included, when the query is still running at the deadline it's stopped, and the partial results
+          so far are returned as a PartialResults list.  Can be a number of seconds or a timedelta from now, or a
+          datetime.  Default: None
+        stop_at_limit: If set to True, the query is stopped as soon as its partial results hold `result_limit` rows,
+          which are returned as a PartialResults list.  Ignored for queries that `sort` or use `stats`, whose partial
+          results aren't the final ones.  Default: False
+        memoize_json: If set to True along with `jsonify`, json is parsed through a cache keyed on the raw string, and
+          keys and short values are interned, which is faster and uses less memory when the same payloads come up
+          again and again.  The parsed objects are shared between rows, so they shouldn't be modified.  Can also be a
+          JsonCache to use instead of this instance's.  Default: False
+        """
+        return self._run_query(
+            query, result_limit=result_limit, group_names=group_names, start_time=start_time, end_time=end_time,
+            post_process=self._results_post_processor(jsonify, typed, memoize_json), callback=callback, error=error,
+            max_bytes=max_bytes, narrow=narrow, deadline=deadline, stop_at_limit=stop_at_limit,
+            mark_partial=PartialResults
+        )
+
+    def get_insights_sweep(self, query_template: str, bindings: List[Any], result_limit: int, group_names: List[str],
+                           start_time: Union[int, datetime, timedelta],
+                           end_time: Union[int, datetime, timedelta, None] = None, mode: str = SweepMode.AUTO,
+                           concurrency: int = 4, max_pack: int = 100, binding_field: str = '@binding',
+                           sort_by: Optional[str] = None, descending: bool = False, max_memory_rows: int = 100000,
+                           **kwargs: Any) -> Iterable[GenericDict]:
+        """
+        Runs a query template for each of a list of bindings, running the queries concurrently.  Returns the rows of
+        all the queries, in the order of the bindings (or sorted, see `sort_by`), each with the binding it came from in
+        `binding_field`
+
+        query_template: An Insights query with a `${name}` placeholder, eg `filter requestId = ${id}`.  Bindings are
+          substituted in as quoted strings, or as they are if they're numbers
+        bindings: The values substituted for the placeholder
+        mode: 'pack', 'fanout' or 'auto'.  'pack' requires the placeholder to be used as `field in ${name}`, and
+          substitutes as many bindings into each query as AWS's query size and result limits and `max_pack` allow, so
+          there are as few queries as possible.  Each row is tagged with the binding found in `field`, so the query
+          should return `field`, otherwise its rows are tagged with None.  'fanout' runs a query per binding.  'auto'
+          packs when the template allows it.  Default: 'auto'
+        concurrency: How many queries to run at once.  Keep this under your account's limit for concurrent Insights
+          queries.  Default: 4
+        max_pack: The most bindings packed into one query.  Default: 100
+        binding_field: The field each row's binding is added as.  Default: '@binding'
+        sort_by: If included, the rows of all the queries are merged into one iterator sorted on this field.  Rows are
+          spilled to sorted temporary files once there are more than `max_memory_rows` of them, so memory stays
+          bounded however many rows there are.  Numeric strings sort as numbers, and values of different types are
+          grouped by type rather than compared.  Default: None
+        descending: With `sort_by`, sort from highest to lowest.  Default: False
+        max_memory_rows: With `sort_by`, the most rows held in memory before spilling to disk.  Default: 100000
+
+        `result_limit` applies to each binding.  A query with packed bindings is run with `result_limit` times as many
+        bindings as it has, and bindings are packed so that stays within AWS's limit of 10000 rows.  Its bindings
+        share those rows, so if it returns all of them, one binding may have crowded out the others and its bindings
+        are run again a query each.  The other keyword
+        arguments are passed to get_insights().  If any of the queries was stopped early (see `deadline` and
+        `stop_at_limit`), the rows are returned as a PartialResults list, or a PartialIterator with `sort_by`, with the
+        first such query's reason
         """
+        if mode not in {SweepMode.AUTO, SweepMode.PACK, SweepMode.FANOUT}:
+            raise ValueError(f"Unknown sweep mode: {mode!r}")
+        name = template_placeholder(query_template)
+        field = packed_field(query_template, name)
+        if mode == SweepMode.PACK and field is None:
+            raise SweepTemplateException(f"To pack bindings, the placeholder must be used as `field in ${{{name}}}`")
+        pack = mode != SweepMode.FANOUT and field is not None
+
+        # resolve relative times once, so every query covers the same range
+        start_time = _normalize_time(start_time)
+        end_time = _normalize_time(end_time if end_time is not None else datetime.now())
+
+        if pack:
+            # so every binding still gets `result_limit` rows
+            max_pack = max(1, min(max_pack, MAX_RESULT_LIMIT // max(result_limit, 1)))
+            batches = pack_bindings(query_template, name, bindings, max_pack)
+        else:
+            batches = [[b] for b in bindings]
+
+        def _partial_reason(rows: List[GenericDict]) -> Optional[str]:
+            return rows.reason if isinstance(rows, PartialResults) else None
+
+        def _run_batch(batch: List[Any]) -> List[GenericDict]:
+            if pack:
+                query = render_packed(query_template, name, batch)
+            else:
+                query = render(query_template, name, batch[0])
+            batch_limit = min(result_limit * len(batch), MAX_RESULT_LIMIT)
+            results = self.get_insights(
+                query, result_limit=batch_limit, group_names=group_names, start_time=start_time, end_time=end_time,
+                **kwargs
+            )
+            rows: List[GenericDict] = PartialResults([], results.reason) if isinstance(results, PartialResults) else []
+            result_count = 0
+            binding_counts: Dict[Any, int] = {}
+            for row in results:
+                result_count += 1
+                binding = find_binding(row, cast(str, field), batch) if pack else batch[0]
+                # so each packed binding gets the rows it would from a query of its own
+                binding_counts[binding] = binding_counts.get(binding, 0) + 1
+                if binding is not None and binding_counts[binding] > result_limit:
+                    continue
+                row[binding_field] = binding
+                rows.append(row)
+
+            if len(batch) > 1 and result_count >= batch_limit:
+                # the bindings share the limit, so one binding's rows may have crowded out the others': run them a
+                # query each instead
+                batch_rows = [_run_batch([b]) for b in batch]
+                rows = [row for binding_rows in batch_rows for row in binding_rows]
+                partial_reason = next((_partial_reason(r) for r in batch_rows if _partial_reason(r) is not None), None)
+                return PartialResults(rows, partial_reason) if partial_reason is not None else rows
+            return rows
+
+        if sort_by is not None:
+            merger = ExternalMerger(sort_by, descending=descending, max_memory_rows=max_memory_rows)
+
+            def _merge_batch(batch: List[Any]) -> Optional[str]:
+                rows = _run_batch(batch)
+                merger.add(rows)
+                return _partial_reason(rows)
+
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                # each batch is handed to the merger as it finishes, so finished batches aren't held in memory
+                partial_reasons = [f.result() for f in [executor.submit(_merge_batch, batch) for batch in batches]]
+            partial_reason = next((r for r in partial_reasons if r is not None), None)
+            merged = merger.merged()
+            return PartialIterator(merged, partial_reason) if partial_reason is not None else merged
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            batch_results = list(executor.map(_run_batch, batches))
+        all_rows = [row for rows in batch_results for row in rows]
+        partial_reason = next((_partial_reason(r) for r in batch_results if _partial_reason(r) is not None), None)
+        return PartialResults(all_rows, partial_reason) if partial_reason is not None else all_rows
+
+    def get_insights_df(self, query: str, result_limit: int, group_names: List[str],
+                        start_time: Union[int, datetime, timedelta],
+                        end_time: Union[int, datetime, timedelta, None] = None,
+                        library: str = DataFrameLibrary.PANDAS, typed: Union[bool, Schema] = False,
+                        expand_json: bool = False, max_bytes: Optional[int] = None, narrow: bool = False) -> Any:
+        """
+        Like get_insights(), but returns a pandas or polars DataFrame, built a column at a time from the raw results.
+        Requires the `[pandas]` or `[polars]` extras
+
+        library: 'pandas' or 'polars'.  Default: 'pandas'
+        typed: The same as in get_insights()
+        expand_json: If set to True, fields holding json objects are expanded into one column per key path, eg
+          `@message.request.id`.  Otherwise they're left as strings.  Default: False
+        max_bytes, narrow: The same as in get_insights()
+        """
+        if library not in {DataFrameLibrary.PANDAS, DataFrameLibrary.POLARS}:
+            raise ValueError(f"Unknown DataFrame library: {library!r}")
+        results_raw = self._run_query(
+            query, result_limit=result_limit, group_names=group_names, start_time=start_time, end_time=end_time,
+            post_process=lambda results_raw_, _: results_raw_, max_bytes=max_bytes, narrow=narrow
+        )
+        return build_dataframe(results_raw, library=library, typed=typed, expand_json=expand_json)
+
+    def _results_post_processor(self, jsonify: bool, typed: Union[bool, Schema], memoize_json: Union[bool, JsonCache]
+                                ) -> Callable[[List[List[ResultFieldTypeDef]], str], Iterable[GenericDict]]:
+        """The post-processing get_insights() does to raw results, as a `post_process` for _run_query()"""
+        json_cache: Optional[JsonCache]
+        if isinstance(memoize_json, JsonCache):
+            json_cache = memoize_json
+        else:
+            json_cache = self.json_cache if memoize_json else None
+
+        def _post_process_results(results_raw_: List[List[ResultFieldTypeDef]], query_id: str) -> Iterable[GenericDict]:
+            results_ = self._post_process_stage(query_id, PostProcessStage.DICTIFY, dictify_results, results_raw_)
+            if jsonify:
+                results_ = self._post_process_stage(
+                    query_id, PostProcessStage.JSONIFY, lambda r: jsonify_insights_results(r, json_cache), results_
+                )
+            if typed:
+                schema = typed if isinstance(typed, dict) else None
+                results_ = self._post_process_stage(
+                    query_id, PostProcessStage.TYPED, lambda r: decode_typed_results(r, schema=schema), results_
+                )
+            return results_
+
+        return _post_process_results
+
+    def _run_query(self, query: str, result_limit: int, group_names: List[str],
+                   start_time: Union[int, datetime, timedelta], end_time: Union[int, datetime, timedelta, None],
+                   post_process: Callable[[List[List[ResultFieldTypeDef]], str], Any],
+                   callback: Optional[Callable[[Any], Any]] = None,
+                   error: Optional[Callable[[BaseException, Any], Any]] = None, max_bytes: Optional[int] = None,
+                   narrow: bool = False, deadline: Union[float, timedelta, datetime, None] = None,
+                   stop_at_limit: bool = False, mark_partial: Optional[Callable[[Any, str], Any]] = None,
+                   on_scanned: Optional[Callable[[int], None]] = None) -> Any:
+        """
+        Runs the query and polls it until it's complete, returning the raw results passed through `post_process`
+        (along with the query id).
+        `callback` and `error` work as in get_insights(), but receive post-processed results.  If the query is stopped
+        early because of `deadline` or `stop_at_limit`, the results are also passed through `mark_partial`, with a
+        PartialReason.  Once a started query is done, however it ended, `on_scanned` is called with the bytes AWS last
+        reported it scanned
+        """
+        deadline_at = time.monotonic() + _deadline_seconds(deadline) if deadline is not None else None
+        stop_at_limit = stop_at_limit and not _is_sorted_query(query)
+
         if end_time is None:
             end_time = datetime.now()
 
-        def _normalize_time(time: Union[int, datetime, timedelta]) -> int:
-            if isinstance(time, int):
-                return time
-            elif isinstance(time, datetime):
-                return int(time.timestamp())
-            elif isinstance(time, timedelta):
-                return int((datetime.now() + time).timestamp())
-            else:
-                raise NotImplementedError()
         start_time = _normalize_time(start_time)
         end_time = _normalize_time(end_time)
 
-        start_query_response = self.logs_client.start_query(
-            logGroupNames=group_names,
-            startTime=start_time,
-            endTime=end_time,
-            queryString=query,
-            limit=result_limit
-        )
+        if max_bytes is not None:
+            try:
+                start_time = self._check_scan_budget(group_names, start_time, end_time, max_bytes, narrow)
+            except ScanBudgetExceededException as e:
+                if error:
+                    error_results = error(e, [])
+                    return error_results if error_results is not None else []
+                raise
+
+        try:
+            start_query_response = self.logs_client.start_query(
+                logGroupNames=group_names,
+                startTime=start_time,
+                endTime=end_time,
+                queryString=query,
+                limit=result_limit
+            )
+        except ClientError as e:
+            self._notify_if_throttled(None, 'StartQuery', e)
+            raise
         query_id = start_query_response['queryId']
-        results: Iterable[GenericDict] = []
+        if self.hooks is not None:
+            self.hooks.on_query_started(query_id, query, group_names)
+        results: Any = []
         response: Union[GenericDict, GetQueryResultsResponseTypeDef] = {}
-
-        def _post_process_results(results_raw_: List[List[ResultFieldTypeDef]]) -> Iterable[GenericDict]:
-            results_ = dictify_results(results_raw_)
-            if jsonify:
-                results_ = jsonify_insights_results(results_)
-            return results_
+        cancel_reason = 'unknown'
+        # every started query gets exactly one of on_completed() or on_cancelled(), so hooks can close what they opened
+        completed_hook_called = False
 
         try:
             while True:
-                response = self.logs_client.get_query_results(queryId=query_id)
+                try:
+                    response = self.logs_client.get_query_results(queryId=query_id)
+                except ClientError as e:
+                    self._notify_if_throttled(query_id, 'GetQueryResults', e)
+                    raise
                 results_raw = response.get('results', [])
                 response_status = response['status']
+                if self.hooks is not None:
+                    self.hooks.on_poll(query_id, response_status, len(results_raw), response.get('statistics', {}))
+                if response_status in {ResponseStatus.RUNNING, ResponseStatus.SCHEDULED}:
+                    # only worth enforcing while stopping the query can still save something: once it's complete,
+                    # it's been billed and may as well be returned
+                    bytes_scanned = response.get('statistics', {}).get('bytesScanned', 0)
+                    if max_bytes is not None and bytes_scanned > max_bytes:
+                        raise ScanBudgetExceededException(int(bytes_scanned), max_bytes, estimated=False)
+                    partial_reason = None
+                    if stop_at_limit and len(results_raw) >= result_limit:
+                        partial_reason = PartialReason.LIMIT
+                    elif deadline_at is not None and time.monotonic() >= deadline_at:
+                        partial_reason = PartialReason.DEADLINE
+                    if partial_reason is not None:
+                        cancel_reason = partial_reason
+                        # a poll can bring the results past the limit
+                        results = post_process(results_raw[:result_limit], query_id)
+                        if mark_partial is not None:
+                            results = mark_partial(results, partial_reason)
+                        break
                 if response_status in {ResponseStatus.RUNNING, ResponseStatus.SCHEDULED} and callback is not None:
-                    results = _post_process_results(results_raw)
+                    results = post_process(results_raw, query_id)
                     callback(results)
                 elif response_status == ResponseStatus.COMPLETE:
-                    results = _post_process_results(results_raw)
+                    results = post_process(results_raw, query_id)
+                    if self.hooks is not None:
+                        completed_hook_called = True
+                        self.hooks.on_completed(query_id, len(results_raw), response.get('statistics', {}))
                     break
                 elif response_status not in {ResponseStatus.RUNNING, ResponseStatus.SCHEDULED, ResponseStatus.COMPLETE}:
                     raise InsightsRemoteException(response_status)
         except BaseException as e:
+            cancel_reason = type(e).__name__
             if error:
                 error_results = error(e, results)
                 if error_results is not None:
@@ -193,5 +538,200 @@ class Insights:
                 except ClientError:
                     # probably couldn't find query to cancel
                     pass
+            if self.hooks is not None and not completed_hook_called:
+                # including queries AWS completed, but that failed afterwards, eg in post-processing
+                self.hooks.on_cancelled(query_id, cancel_reason)
+            if on_scanned is not None:
+                on_scanned(int(response.get('statistics', {}).get('bytesScanned', 0)))
 
         return results
+
+    def _post_process_stage(self, query_id: str, stage: str, func: Callable[[Any], Iterable[GenericDict]],
+                            results: Any) -> Iterable[GenericDict]:
+        """
+        Applies a post-processing stage.  Stages are lazy, but when there are hooks each stage is run to completion so
+        it can be timed
+        """
+        if self.hooks is None:
+            return func(results)
+        started = time.perf_counter()
+        processed = list(func(results))
+        self.hooks.on_post_processed(query_id, stage, time.perf_counter() - started, len(processed))
+        return processed
+
+    def _notify_if_throttled(self, query_id: Optional[str], operation: str, error: ClientError) -> None:
+        if self.hooks is not None and error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+            self.hooks.on_throttled(query_id, operation, error)
+
+    def _check_scan_budget(self, group_names: List[str], start_time: int, end_time: int, max_bytes: int,
+                           narrow: bool) -> int:
+        """Returns the start time to use, raising ScanBudgetExceededException if the query can't fit the budget"""
+        estimated_bytes = self.scan_estimator.estimate_bytes(group_names, start_time, end_time)
+        if estimated_bytes <= max_bytes:
+            return start_time
+        if narrow:
+            narrowed_start_time = self.scan_estimator.narrow_start_time(group_names, start_time, end_time, max_bytes)
+            if narrowed_start_time < end_time:
+                return narrowed_start_time
+        raise ScanBudgetExceededException(estimated_bytes, max_bytes, estimated=True)
+
+    def export_insights(self, query: str, result_limit: int, group_names: List[str],
+                        start_time: Union[int, datetime, timedelta], out_file: str, checkpoint_dir: str,
+                        end_time: Union[int, datetime, timedelta, None] = None,
+                        window: Union[int, timedelta] = timedelta(days=1), resume: bool = False,
+                        callback: Optional[CallbackFunction] = None, jsonify: bool = True,
+                        typed: Union[bool, Schema] = False, max_bytes: Optional[int] = None,
+                        memoize_json: Union[bool, JsonCache] = False, processes: Optional[int] = None,
+                        min_pool_rows: int = 1000) -> int:
+        """
+        Runs a query over a long time range as a series of smaller windows, writing the results as jsonl to a file and
+        recording each finished window in a manifest in `checkpoint_dir`, so an interrupted export can be resumed.
+
+        Returns the total number of rows in `out_file`
+
+        window: The length of each sub-window, either in seconds or as a timedelta.  `result_limit` applies to each
+          window separately, and a window that returns that many rows was probably cut short, which is warned about
+          with a TruncatedWindowWarning and recorded in the manifest.  Default: 1 day
+        resume: If True and `checkpoint_dir` has a manifest, skips the windows it records as completed and continues
+          from there.  The time range and window length are taken from the manifest, so relative times don't drift
+          between runs.  The query, groups, limit, jsonify and typed must match the original run.  If False, any
+          existing checkpoint is discarded and the export starts over
+        max_bytes: If included, a budget for the bytes scanned by the whole export, including the windows of earlier
+          runs when resuming.  The export is refused if the windows left to run are estimated to go over what's left
+          of it.  Each window is given what's left of it, less what the windows before it scanned, and the export
+          stops with a ScanBudgetExceededException as soon as a window goes over that
+        processes: If included, each window's results are post-processed and encoded on a pool of this many processes
+          (0 for one per CPU), while the next window's query runs.  Worth it for exports with many large, json heavy
+          windows.  Hooks aren't told about post-processing stages run in the pool, and with `memoize_json` each
+          process has its own cache.  Default: None
+        min_pool_rows: With `processes`, windows with fewer rows than this are post-processed and encoded here
+          instead, since sending them to the pool would cost more than it saves.  Default: 1000
+
+        The other arguments are the same as for get_insights()
+        """
+        manifest = load_manifest(checkpoint_dir) if resume else None
+        if manifest is not None:
+            manifest.check_matches(query, group_names, result_limit, jsonify, typed)
+        else:
+            window_seconds = int(window.total_seconds()) if isinstance(window, timedelta) else int(window)
+            manifest = CheckpointManifest(
+                query=query,
+                group_names=group_names,
+                result_limit=result_limit,
+                start_time=_normalize_time(start_time),
+                end_time=_normalize_time(end_time if end_time is not None else datetime.now()),
+                window_seconds=window_seconds,
+                jsonify=jsonify,
+                typed=typed
+            )
+            save_manifest(checkpoint_dir, manifest)
+
+        if manifest.completed and (not os.path.exists(out_file) or os.path.getsize(out_file) < manifest.offset):
+            # the output doesn't hold what the manifest says it does, so none of the recorded work can be trusted
+            manifest.completed = []
+            save_manifest(checkpoint_dir, manifest)
+
+        pending_windows = manifest.pending_windows()
+        if max_bytes is not None and pending_windows:
+            self._check_scan_budget(
+                group_names, pending_windows[0][0], pending_windows[-1][1], max_bytes - manifest.bytes_scanned,
+                narrow=False
+            )
+
+        post_process_results = self._results_post_processor(jsonify, typed, memoize_json)
+        # bytes scanned by windows, including ones that don't finish, which are billed all the same
+        spent = manifest.bytes_scanned
+        scanned_by_window: Dict[Tuple[int, int], int] = {}
+
+        def _run_window(window_: Tuple[int, int], post_process: Callable[[List[List[ResultFieldTypeDef]], str], Any],
+                        window_callback: Optional[Callable[[Any], Any]]) -> Any:
+            window_budget = None
+            if max_bytes is not None:
+                window_budget = max_bytes - spent
+                if window_budget <= 0:
+                    raise ScanBudgetExceededException(spent, max_bytes, estimated=False)
+
+            def _on_scanned(bytes_scanned: int) -> None:
+                nonlocal spent
+                spent += bytes_scanned
+                scanned_by_window[window_] = bytes_scanned
+
+            return self._run_query(
+                query, result_limit=result_limit, group_names=group_names, start_time=window_[0],
+                end_time=window_[1], post_process=post_process, callback=window_callback, max_bytes=window_budget,
+                on_scanned=_on_scanned
+            )
+
+        mode = 'r+b' if manifest.completed else 'wb'
+        with open(out_file, mode) as fout:
+            # drop anything written by a window that didn't finish
+            fout.seek(manifest.offset)
+            fout.truncate()
+
+            def _finish_window(window_start: int, window_end: int, rows: int) -> None:
+                fout.flush()
+                os.fsync(fout.fileno())
+                truncated = rows >= result_limit
+                if truncated:
+                    warnings.warn(TruncatedWindowWarning(
+                        f"The window from {window_start} to {window_end} returned {rows} rows, the result limit, so it"
+                        f" probably has more.  Use a smaller window or a larger result limit"
+                    ))
+                manifest.completed.append(ExportWindow(
+                    start_time=window_start, end_time=window_end, rows=rows, offset=fout.tell(), truncated=truncated,
+                    bytes_scanned=scanned_by_window.pop((window_start, window_end), 0)
+                ))
+                save_manifest(checkpoint_dir, manifest)
+
+            if processes is not None:
+                self._export_windows_in_pool(
+                    pending_windows, _run_window, post_process_results, processes, min_pool_rows, callback, jsonify,
+                    typed, bool(memoize_json), fout, _finish_window
+                )
+                return manifest.rows
+
+            for window_start, window_end in pending_windows:
+                results = _run_window((window_start, window_end), post_process_results, callback)
+                rows = 0
+                for row in results:
+                    fout.write((json.dumps(row, default=str) + "\n").encode())
+                    rows += 1
+                _finish_window(window_start, window_end, rows)
+
+        return manifest.rows
+
+    def _export_windows_in_pool(self, windows: List[Tuple[int, int]], run_window: Callable[..., Any],
+                                post_process_results: Callable[[List[List[ResultFieldTypeDef]], str], Any],
+                                processes: int, min_pool_rows: int, callback: Optional[CallbackFunction],
+                                jsonify: bool, typed: Union[bool, Schema], memoize_json: bool, fout: Any,
+                                finish_window: Callable[[int, int, int], None]) -> None:
+        """
+        Runs the windows' queries one after another with `run_window`, encoding each window's results in the pool
+        while the next query runs, and writing them out in order.  Windows with fewer than `min_pool_rows` rows, and
+        the partial results passed to `callback`, are post-processed here with `post_process_results`
+        """
+        def _on_encoded(window: Tuple[int, int], encoded: Tuple[bytes, int]) -> None:
+            lines, rows = encoded
+            fout.write(lines)
+            finish_window(window[0], window[1], rows)
+
+        with OrderedProcessPipeline(processes) as pipeline:
+            try:
+                for window in windows:
+                    # the raw results are kept with their query id, so they can be post-processed later the way
+                    # get_insights() would have
+                    results_raw, query_id = run_window(
+                        window, lambda results_raw_, query_id_: (results_raw_, query_id_),
+                        (lambda r: callback(post_process_results(*r))) if callback is not None else None
+                    )
+                    if len(results_raw) < min_pool_rows:
+                        pipeline.submit_inline(
+                            partial(_on_encoded, window), _encode_rows, post_process_results(results_raw, query_id)
+                        )
+                    else:
+                        pipeline.submit(
+                            partial(_on_encoded, window), _encode_jsonl, results_raw, jsonify, typed, memoize_json
+                        )
+            finally:
+                # the windows that did finish are still worth checkpointing
+                pipeline.drain()
@@ -8,7 +8,7 @@ from unittest.mock import MagicMock, call
 import pytest
 
 from aws_cloudwatch_insights.aws_cloudwatch_insights import ResponseStatus, Insights, GenericDict, ErrorFunction, \
-    CallbackFunction
+    CallbackFunction, PartialResults, PartialReason
 
 
 def test_get_insights():
@@ -218,3 +218,83 @@ def test_get_insights_multi_error(with_callback: bool, does_error_return_somethi
         assert actual_results == fake_error_return
     else:
         assert actual_results == []
+
+
+def test_get_insights_typed():
+    mock_logs_client = MagicMock()
+    mock_logs_client.start_query.return_value = {'queryId': f"fake-query-id-{token_hex(4)}"}
+    mock_logs_client.get_query_results.return_value = {
+        'status': ResponseStatus.COMPLETE,
+        'results': [
+            [{'field': '@timestamp', 'value': '2023-02-20 14:56:40.123'}, {'field': 'count', 'value': '3'}],
+            [{'field': '@timestamp', 'value': '2023-02-20 14:56:41.000'}, {'field': 'count', 'value': '12'}],
+        ]
+    }
+
+    actual_results = list(Insights(mock_logs_client).get_insights(
+        query='stats count(*) as count by bin(1s)', result_limit=10, start_time=0, end_time=100,
+        group_names=['/aws/lambda/test'], typed=True
+    ))
+
+    assert actual_results == [
+        {'@timestamp': 1676905000123, 'count': 3},
+        {'@timestamp': 1676905001000, 'count': 12},
+    ]
+
+
+def _running_mock_logs_client(rows_per_poll: int, polls: int) -> MagicMock:
+    mock_logs_client = MagicMock()
+    mock_logs_client.start_query.return_value = {'queryId': f"fake-query-id-{token_hex(4)}"}
+    final_results = [[{'field': 'foo', 'value': str(i)}] for i in range(rows_per_poll * polls)]
+    get_results_side_effects: List[GenericDict] = [
+        {'status': ResponseStatus.RUNNING, 'results': final_results[:rows_per_poll * i]} for i in range(1, polls + 1)
+    ]
+    get_results_side_effects[-1]['status'] = ResponseStatus.COMPLETE
+    mock_logs_client.get_query_results.side_effect = get_results_side_effects
+    return mock_logs_client
+
+
+@pytest.mark.parametrize('query,expect_early_exit', [
+    ('fields @message', True),
+    ('fields @message | sort @timestamp desc', False),
+    ('stats count(*) by bin(1h)', False),
+])
+def test_get_insights_stop_at_limit(query, expect_early_exit):
+    mock_logs_client = _running_mock_logs_client(rows_per_poll=2, polls=5)
+
+    actual_results = Insights(mock_logs_client).get_insights(
+        query=query, result_limit=3, start_time=0, end_time=100, group_names=['/aws/lambda/test'], stop_at_limit=True
+    )
+
+    if expect_early_exit:
+        assert isinstance(actual_results, PartialResults)
+        assert actual_results.reason == PartialReason.LIMIT
+        assert list(actual_results) == [{'foo': str(i)} for i in range(3)]
+        assert mock_logs_client.get_query_results.call_count == 2
+        assert mock_logs_client.stop_query.call_count == 1
+    else:
+        assert not isinstance(actual_results, PartialResults)
+        assert len(list(actual_results)) == 10
+        assert mock_logs_client.stop_query.call_count == 0
+
+
+def test_get_insights_deadline(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('aws_cloudwatch_insights.aws_cloudwatch_insights.time.monotonic', lambda: now[0])
+    mock_logs_client = _running_mock_logs_client(rows_per_poll=1, polls=5)
+
+    def _get_query_results(**kwargs):
+        now[0] += 1
+        return mock_side_effects.pop(0)
+    mock_side_effects = list(mock_logs_client.get_query_results.side_effect)
+    mock_logs_client.get_query_results.side_effect = _get_query_results
+
+    actual_results = Insights(mock_logs_client).get_insights(
+        query='fields @message', result_limit=100, start_time=0, end_time=100, group_names=['/aws/lambda/test'],
+        deadline=2.5
+    )
+
+    assert isinstance(actual_results, PartialResults)
+    assert actual_results.reason == PartialReason.DEADLINE
+    assert list(actual_results) == [{'foo': str(i)} for i in range(3)]
+    assert mock_logs_client.stop_query.call_count == 1
@@ -0,0 +1,236 @@
+"""Record and replay Insights API traffic, for deterministic offline benchmarking."""
+import gzip
+import json
+import threading
+import time
+from collections import deque
+from typing import Optional, List, Dict, Any, Mapping, Deque, Iterator, Callable, cast
+
+from botocore.exceptions import ClientError
+
+from .aws_cloudwatch_insights import GenericDict, CloudWatchLogsClient
+
+CASSETTE_VERSION = 1
+
+
+class CassetteException(Exception):
+    """The code being replayed made calls that don't match the recording"""
+
+
+def _strip_response(response: Mapping[str, Any]) -> GenericDict:
+    return {k: v for k, v in response.items() if k != 'ResponseMetadata'}
+
+
+def _client_error_dict(error: ClientError) -> GenericDict:
+    return {
+        'Code': error.response.get('Error', {}).get('Code'),
+        'Message': error.response.get('Error', {}).get('Message'),
+        'operation': error.operation_name
+    }
+
+
+def _raise_client_error(error: GenericDict) -> None:
+    raise ClientError({'Error': {'Code': error['Code'], 'Message': error['Message']}}, error['operation'])
+
+
+def _start_key(start_kwargs: Mapping[str, Any]) -> str:
+    """What a replayed start_query() call is matched to a recorded one on"""
+    return json.dumps([
+        start_kwargs.get('queryString'),
+        sorted(start_kwargs.get('logGroupNames') or []),
+        start_kwargs.get('startTime'),
+        start_kwargs.get('endTime'),
+    ], default=str)
+
+
+def _paginate_key(kwargs: Mapping[str, Any]) -> str:
+    return json.dumps(kwargs, sort_keys=True, default=str)
+
+
+class _Paginator:
+    """Stands in for a boto3 paginator, getting its pages from `paginate`"""
+    def __init__(self, paginate: Callable[..., Iterator[GenericDict]]):
+        self.paginate = paginate
+
+
+class RecordingClient:
+    def __init__(self, logs_client: CloudWatchLogsClient):
+        """
+        Wraps a logs client, recording every start_query, get_query_results and stop_query call, its response and its
+        timing, along with the describe_log_groups pages used to estimate scans (eg for `max_bytes`).  Anything else is
+        passed through to the client unrecorded.  Pass it to Insights() in place of the client, then save() the
+        recording
+        """
+        self.logs_client = logs_client
+        self.queries: List[GenericDict] = []
+        self.log_group_pages: List[GenericDict] = []
+        self._queries_by_id: Dict[str, GenericDict] = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for what isn't recorded, which is passed through to the client
+        if name == 'logs_client':
+            raise AttributeError(name)
+        return getattr(self.logs_client, name)
+
+    def _paginate_log_groups(self, **kwargs: Any) -> Iterator[GenericDict]:
+        # recorded as they're read, since callers often stop paginating once they've found their group
+        pages: List[GenericDict] = []
+        with self._lock:
+            self.log_group_pages.append({'kwargs': kwargs, 'pages': pages})
+        for page in self.logs_client.get_paginator('describe_log_groups').paginate(**kwargs):
+            pages.append(_strip_response(page))
+            yield cast(GenericDict, page)
+
+    def get_paginator(self, operation_name: str) -> Any:
+        if operation_name == 'describe_log_groups':
+            return _Paginator(self._paginate_log_groups)
+        return self.logs_client.get_paginator(operation_name)  # type: ignore[call-overload]
+
+    def start_query(self, **kwargs: Any) -> GenericDict:
+        started = time.monotonic()
+        response = self.logs_client.start_query(**kwargs)
+        query = {
+            'start_kwargs': kwargs,
+            'query_id': response['queryId'],
+            'duration': time.monotonic() - started,
+            'polls': [],
+            'stopped': False,
+            '_started': started
+        }
+        with self._lock:
+            self.queries.append(query)
+            self._queries_by_id[response['queryId']] = query
+        return cast(GenericDict, response)
+
+    def get_query_results(self, queryId: str, **kwargs: Any) -> GenericDict:
+        query = self._queries_by_id[queryId]
+        started = time.monotonic()
+        poll: GenericDict = {'at': started - query['_started']}
+        try:
+            response = self.logs_client.get_query_results(queryId=queryId, **kwargs)
+            poll['response'] = _strip_response(response)
+            return cast(GenericDict, response)
+        except ClientError as e:
+            poll['error'] = _client_error_dict(e)
+            raise
+        finally:
+            poll['duration'] = time.monotonic() - started
+            query['polls'].append(poll)
+
+    def stop_query(self, queryId: str, **kwargs: Any) -> GenericDict:
+        self._queries_by_id[queryId]['stopped'] = True
+        return cast(GenericDict, self.logs_client.stop_query(queryId=queryId, **kwargs))
+
+    def save(self, path: str) -> None:
+        """Writes the recording as gzipped json"""
+        cassette = {
+            'version': CASSETTE_VERSION,
+            'queries': [{k: v for k, v in q.items() if not k.startswith('_')} for q in self.queries],
+            'log_group_pages': self.log_group_pages
+        }
+        with gzip.open(path, 'wt') as f:
+            json.dump(cassette, f, separators=(',', ':'), default=str)
+
+
+class ReplayClient:
+    def __init__(self, path: str, speed: Optional[float] = None):
+        """
+        A stand-in for a logs client which plays back a recording from RecordingClient.save(), with no network access.
+
+        Each start_query() is matched to a recorded one with the same query string, log groups and time range, in the
+        order those were recorded, so queries started concurrently (eg by a sweep) can start in any order.  Recordings
+        should be made with absolute times for that reason.  describe_log_groups pages are replayed for the arguments
+        they were recorded with, so scan estimates (eg for `max_bytes`) work offline too.  The code being replayed
+        doesn't need to poll the same number of times as the original:
+
+        speed: If None, replays as fast as possible, each get_query_results() returning the next recorded response
+          (and the final one from then on).  Otherwise replays in simulated time: each call sleeps for the recorded
+          call's duration and get_query_results() returns the latest response recorded by that point in the query.
+          1.0 is the original speed, 2.0 twice as fast, etc
+        """
+        with gzip.open(path, 'rt') as f:
+            cassette = json.load(f)
+        if cassette.get('version') != CASSETTE_VERSION:
+            raise CassetteException(f"Unsupported cassette version: {cassette.get('version')!r}")
+        self.queries: List[GenericDict] = cassette['queries']
+        self.speed = speed
+        self._unstarted: Dict[str, Deque[GenericDict]] = {}
+        for query in self.queries:
+            self._unstarted.setdefault(_start_key(query['start_kwargs']), deque()).append(query)
+        self._log_group_pages: Dict[str, List[GenericDict]] = {
+            _paginate_key(recorded['kwargs']): recorded['pages'] for recorded in cassette.get('log_group_pages', [])
+        }
+        self._lock = threading.Lock()
+        self._started: Dict[str, float] = {}
+        self._polls_made: Dict[str, int] = {}
+        self._queries_by_id: Dict[str, GenericDict] = {}
+
+    def _sleep(self, seconds: float) -> None:
+        if self.speed is not None:
+            time.sleep(seconds / self.speed)
+
+    def start_query(self, **kwargs: Any) -> GenericDict:
+        with self._lock:
+            unstarted = self._unstarted.get(_start_key(kwargs))
+            if not unstarted:
+                raise CassetteException(
+                    f"No recorded query left matching {kwargs.get('queryString')!r} on {kwargs.get('logGroupNames')!r}"
+                    f" from {kwargs.get('startTime')!r} to {kwargs.get('endTime')!r}"
+                )
+            query = unstarted.popleft()
+        self._sleep(query['duration'])
+        query_id = query['query_id']
+        with self._lock:
+            self._queries_by_id[query_id] = query
+            self._started[query_id] = time.monotonic()
+            self._polls_made[query_id] = 0
+        return {'queryId': query_id}
+
+    def _pick_poll(self, query_id: str) -> GenericDict:
+        polls = self._queries_by_id[query_id]['polls']
+        if not polls:
+            raise CassetteException(f"No results were recorded for query {query_id!r}")
+        if self.speed is None:
+            index = min(self._polls_made[query_id], len(polls) - 1)
+        else:
+            elapsed = (time.monotonic() - self._started[query_id]) * self.speed
+            index = 0
+            for i, poll in enumerate(polls):
+                if poll['at'] <= elapsed:
+                    index = i
+        self._polls_made[query_id] += 1
+        return polls[index]
+
+    def get_query_results(self, queryId: str, **kwargs: Any) -> GenericDict:
+        with self._lock:
+            if queryId not in self._queries_by_id:
+                raise CassetteException(f"Unknown query id {queryId!r}")
+            poll = self._pick_poll(queryId)
+        self._sleep(poll['duration'])
+        if 'error' in poll:
+            _raise_client_error(poll['error'])
+        return poll['response']
+
+    def stop_query(self, queryId: str, **kwargs: Any) -> GenericDict:
+        if queryId not in self._queries_by_id:
+            raise CassetteException(f"Unknown query id {queryId!r}")
+        return {'success': True}
+
+    def _paginate_log_groups(self, **kwargs: Any) -> Iterator[GenericDict]:
+        pages = self._log_group_pages.get(_paginate_key(kwargs))
+        if pages is None:
+            raise CassetteException(f"No describe_log_groups pages were recorded for {kwargs!r}")
+        yield from pages
+
+    def get_paginator(self, operation_name: str) -> Any:
+        if operation_name != 'describe_log_groups':
+            raise CassetteException(f"Only describe_log_groups is recorded, not {operation_name!r}")
+        return _Paginator(self._paginate_log_groups)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        raise CassetteException(
+            f"{name!r} isn't recorded: only start_query, get_query_results, stop_query and describe_log_groups are"
+        )
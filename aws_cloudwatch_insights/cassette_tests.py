@@ -0,0 +1,141 @@
+import gzip
+import json
+from typing import List
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from aws_cloudwatch_insights.aws_cloudwatch_insights import Insights, ResponseStatus, GenericDict
+from aws_cloudwatch_insights.cassette import RecordingClient, ReplayClient, CassetteException
+
+QUERY = 'fields @message'
+FINAL_RESULTS = [[{'field': 'foo', 'value': str(i)}] for i in (1, 2, 3)]
+
+
+def _mock_logs_client() -> MagicMock:
+    mock_logs_client = MagicMock()
+    mock_logs_client.start_query.return_value = {'queryId': 'fake-query-id'}
+    get_results_side_effects: List[GenericDict] = [
+        {'status': ResponseStatus.SCHEDULED, 'ResponseMetadata': {'RetryAttempts': 0}},
+    ]
+    for i in (1, 2, 3):
+        get_results_side_effects.append({'status': ResponseStatus.RUNNING, 'results': FINAL_RESULTS[:i]})
+    get_results_side_effects[-1]['status'] = ResponseStatus.COMPLETE
+    mock_logs_client.get_query_results.side_effect = get_results_side_effects
+    return mock_logs_client
+
+
+def _get_insights(logs_client) -> List[GenericDict]:
+    return list(Insights(logs_client).get_insights(
+        query=QUERY, result_limit=10, group_names=['/aws/lambda/a'], start_time=0, end_time=100
+    ))
+
+
+@pytest.fixture
+def cassette_path(tmp_path) -> str:
+    recording_client = RecordingClient(_mock_logs_client())
+    assert _get_insights(recording_client) == [{'foo': str(i)} for i in (1, 2, 3)]
+    path = str(tmp_path / 'cassette.json.gz')
+    recording_client.save(path)
+    return path
+
+
+def test_record(cassette_path):
+    with gzip.open(cassette_path, 'rt') as f:
+        cassette = json.load(f)
+    [query] = cassette['queries']
+    assert query['query_id'] == 'fake-query-id'
+    assert query['start_kwargs']['queryString'] == QUERY
+    assert [p['response']['status'] for p in query['polls']] == [
+        ResponseStatus.SCHEDULED, ResponseStatus.RUNNING, ResponseStatus.RUNNING, ResponseStatus.COMPLETE
+    ]
+    assert 'ResponseMetadata' not in query['polls'][0]['response']
+    assert not query['stopped']
+
+
+@pytest.mark.parametrize('speed', [None, 1000.0])
+def test_replay(cassette_path, speed):
+    replay_client = ReplayClient(cassette_path, speed=speed)
+    assert _get_insights(replay_client) == [{'foo': str(i)} for i in (1, 2, 3)]
+
+
+def test_replay_too_many_queries(cassette_path):
+    replay_client = ReplayClient(cassette_path)
+    _get_insights(replay_client)
+    with pytest.raises(CassetteException):
+        _get_insights(replay_client)
+
+
+def test_replay_wrong_query(cassette_path):
+    with pytest.raises(CassetteException):
+        list(Insights(ReplayClient(cassette_path)).get_insights(
+            query='some other query', result_limit=10, group_names=['/aws/lambda/a'], start_time=0, end_time=100
+        ))
+
+
+def test_replay_matches_start_kwargs(tmp_path):
+    mock_logs_client = MagicMock()
+    mock_logs_client.start_query.side_effect = lambda startTime, **_: {'queryId': f"query-{startTime}"}
+    mock_logs_client.get_query_results.side_effect = lambda queryId: {
+        'status': ResponseStatus.COMPLETE, 'results': [[{'field': 'id', 'value': queryId}]]
+    }
+
+    def _get_window(logs_client, start_time: int) -> List[GenericDict]:
+        return list(Insights(logs_client).get_insights(
+            query=QUERY, result_limit=10, group_names=['/aws/lambda/a'], start_time=start_time, end_time=start_time + 9
+        ))
+
+    recording_client = RecordingClient(mock_logs_client)
+    for start_time in (0, 10, 20):
+        _get_window(recording_client, start_time)
+    path = str(tmp_path / 'cassette.json.gz')
+    recording_client.save(path)
+
+    replay_client = ReplayClient(path)
+    # started in a different order than they were recorded, as concurrent queries can be
+    for start_time in (20, 0, 10):
+        assert _get_window(replay_client, start_time) == [{'id': f"query-{start_time}"}]
+    with pytest.raises(CassetteException):
+        _get_window(replay_client, 0)
+
+
+def test_record_replay_log_groups(tmp_path):
+    mock_logs_client = _mock_logs_client()
+    mock_logs_client.get_paginator.return_value.paginate.side_effect = lambda logGroupNamePrefix: [
+        {'logGroups': [{'logGroupName': logGroupNamePrefix, 'storedBytes': 10 ** 12, 'creationTime': 0}]},
+    ]
+    recording_client = RecordingClient(mock_logs_client)
+    insights = Insights(recording_client)
+    estimated_bytes = insights.estimate_scan_bytes(['/aws/lambda/a'], start_time=0, end_time=100)
+    assert estimated_bytes > 0
+    _get_insights(recording_client)
+    assert recording_client.meta is mock_logs_client.meta, "What isn't recorded is passed through"
+    path = str(tmp_path / 'cassette.json.gz')
+    recording_client.save(path)
+
+    replay_client = ReplayClient(path)
+    assert Insights(replay_client).estimate_scan_bytes(['/aws/lambda/a'], start_time=0, end_time=100) == \
+        estimated_bytes
+    with pytest.raises(CassetteException):
+        Insights(replay_client).estimate_scan_bytes(['/aws/lambda/b'], start_time=0, end_time=100)
+    with pytest.raises(CassetteException, match='describe_log_streams'):
+        replay_client.describe_log_streams()
+
+
+def test_record_replay_error(tmp_path):
+    mock_logs_client = MagicMock()
+    mock_logs_client.start_query.return_value = {'queryId': 'fake-query-id'}
+    mock_logs_client.get_query_results.side_effect = ClientError(
+        {'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, 'GetQueryResults'
+    )
+    recording_client = RecordingClient(mock_logs_client)
+    with pytest.raises(ClientError):
+        _get_insights(recording_client)
+    assert recording_client.queries[0]['stopped']
+    path = str(tmp_path / 'cassette.json.gz')
+    recording_client.save(path)
+
+    with pytest.raises(ClientError) as exc_info:
+        _get_insights(ReplayClient(path))
+    assert exc_info.value.response['Error']['Code'] == 'ThrottlingException'
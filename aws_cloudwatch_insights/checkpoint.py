@@ -0,0 +1,119 @@
+"""Manifest handling for checkpointed, resumable exports."""
+import json
+import os
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional, Dict, Any, Tuple, Union
+
+MANIFEST_FILE_NAME = 'manifest.json'
+
+
+class CheckpointMismatchException(Exception):
+    def __init__(self, field_name: str):
+        super().__init__(f"Checkpoint was created with a different {field_name!r}, can't resume from it")
+        self.field_name = field_name
+
+
+class TruncatedWindowWarning(UserWarning):
+    """An export window returned `result_limit` rows, so it probably had more that were left out"""
+
+
+@dataclass
+class ExportWindow:
+    start_time: int
+    end_time: int
+    rows: int
+    offset: int
+    truncated: bool = False
+    bytes_scanned: int = 0
+
+
+@dataclass
+class CheckpointManifest:
+    query: str
+    group_names: List[str]
+    result_limit: int
+    start_time: int
+    end_time: int
+    window_seconds: int
+    jsonify: bool
+    typed: Union[bool, Dict[str, str]] = False
+    completed: List[ExportWindow] = field(default_factory=list)
+
+    @property
+    def offset(self) -> int:
+        """The output offset after the last completed window"""
+        return self.completed[-1].offset if self.completed else 0
+
+    @property
+    def rows(self) -> int:
+        return sum(w.rows for w in self.completed)
+
+    @property
+    def bytes_scanned(self) -> int:
+        return sum(w.bytes_scanned for w in self.completed)
+
+    def windows(self) -> List[Tuple[int, int]]:
+        return split_windows(self.start_time, self.end_time, self.window_seconds)
+
+    def pending_windows(self) -> List[Tuple[int, int]]:
+        done = {(w.start_time, w.end_time) for w in self.completed}
+        return [w for w in self.windows() if w not in done]
+
+    def check_matches(self, query: str, group_names: List[str], result_limit: int, jsonify: bool,
+                      typed: Union[bool, Dict[str, str]] = False) -> None:
+        if self.query != query:
+            raise CheckpointMismatchException('query')
+        if sorted(self.group_names) != sorted(group_names):
+            raise CheckpointMismatchException('group_names')
+        if self.result_limit != result_limit:
+            raise CheckpointMismatchException('result_limit')
+        if self.jsonify != jsonify:
+            raise CheckpointMismatchException('jsonify')
+        if self.typed != typed:
+            raise CheckpointMismatchException('typed')
+
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Any]) -> 'CheckpointManifest':
+        raw = dict(raw)
+        completed = [ExportWindow(**w) for w in raw.pop('completed', [])]
+        return cls(**raw, completed=completed)
+
+
+def split_windows(start_time: int, end_time: int, window_seconds: int) -> List[Tuple[int, int]]:
+    """
+    Splits [start_time, end_time] into consecutive sub-windows of at most `window_seconds`.  Since Insights treats
+    both ends of a range as inclusive, each window ends one second before the next one starts
+    """
+    if window_seconds <= 0:
+        raise ValueError(f"window_seconds must be positive, got {window_seconds!r}")
+    windows = []
+    window_start = start_time
+    while window_start <= end_time:
+        window_end = min(window_start + window_seconds - 1, end_time)
+        windows.append((window_start, window_end))
+        window_start = window_end + 1
+    return windows
+
+
+def manifest_path(checkpoint_dir: str) -> str:
+    return os.path.join(checkpoint_dir, MANIFEST_FILE_NAME)
+
+
+def load_manifest(checkpoint_dir: str) -> Optional[CheckpointManifest]:
+    path = manifest_path(checkpoint_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return CheckpointManifest.from_dict(json.load(f))
+
+
+def save_manifest(checkpoint_dir: str, manifest: CheckpointManifest) -> None:
+    """Writes the manifest atomically, so a crash mid-write never leaves a corrupt checkpoint"""
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = manifest_path(checkpoint_dir)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(asdict(manifest), f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,194 @@
+import json
+import os
+from typing import List, Tuple, Optional
+from unittest.mock import MagicMock
+
+import pytest
+
+from aws_cloudwatch_insights.aws_cloudwatch_insights import Insights, ResponseStatus, GenericDict
+from aws_cloudwatch_insights.checkpoint import split_windows, load_manifest, CheckpointMismatchException, \
+    TruncatedWindowWarning
+from aws_cloudwatch_insights.cost import ScanBudgetExceededException
+from aws_cloudwatch_insights.parallel import OrderedProcessPipeline
+
+QUERY = 'fields @timestamp, @message'
+GROUP_NAMES = ['/aws/lambda/a', '/aws/lambda/b']
+
+
+def test_split_windows():
+    assert split_windows(0, 25, 10) == [(0, 9), (10, 19), (20, 25)]
+    assert split_windows(0, 19, 10) == [(0, 9), (10, 19)]
+    assert split_windows(5, 5, 10) == [(5, 5)]
+    with pytest.raises(ValueError):
+        split_windows(0, 10, 0)
+
+
+def _mock_logs_client(fail_on_window: int = -1, bytes_scanned: int = 0) -> MagicMock:
+    """
+    A client that returns one row per window, containing the window's start time, reports scanning `bytes_scanned` per
+    window, and fails on a given window
+    """
+    mock_logs_client = MagicMock()
+    started: List[Tuple[int, int]] = []
+
+    def _start_query(startTime: int, endTime: int, **_) -> GenericDict:
+        if len(started) == fail_on_window:
+            raise KeyboardInterrupt()
+        started.append((startTime, endTime))
+        return {'queryId': str(len(started))}
+
+    def _get_query_results(queryId: str) -> GenericDict:
+        start_time, _ = started[int(queryId) - 1]
+        return {
+            'status': ResponseStatus.COMPLETE, 'results': [[{'field': 'start', 'value': start_time}]],
+            'statistics': {'bytesScanned': bytes_scanned}
+        }
+
+    mock_logs_client.start_query.side_effect = _start_query
+    mock_logs_client.get_query_results.side_effect = _get_query_results
+    mock_logs_client.started = started
+    return mock_logs_client
+
+
+def _export(logs_client: MagicMock, tmp_path, resume: bool, start_time: int = 0, end_time: int = 49,
+            processes: Optional[int] = None, result_limit: int = 100, max_bytes: Optional[int] = None,
+            min_pool_rows: int = 0) -> int:
+    return Insights(logs_client).export_insights(
+        query=QUERY,
+        result_limit=result_limit,
+        group_names=GROUP_NAMES,
+        start_time=start_time,
+        end_time=end_time,
+        out_file=str(tmp_path / 'out.jsonl'),
+        checkpoint_dir=str(tmp_path / 'checkpoint'),
+        window=10,
+        resume=resume,
+        processes=processes,
+        max_bytes=max_bytes,
+        min_pool_rows=min_pool_rows
+    )
+
+
+def _read_out(tmp_path) -> List[GenericDict]:
+    with open(tmp_path / 'out.jsonl', 'r') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_export_insights(tmp_path, processes):
+    logs_client = _mock_logs_client()
+    assert _export(logs_client, tmp_path, resume=False, processes=processes) == 5
+    assert logs_client.started == [(0, 9), (10, 19), (20, 29), (30, 39), (40, 49)]
+    assert _read_out(tmp_path) == [{'start': i} for i in (0, 10, 20, 30, 40)]
+
+    manifest = load_manifest(str(tmp_path / 'checkpoint'))
+    assert manifest is not None
+    assert manifest.pending_windows() == []
+    assert manifest.offset == os.path.getsize(tmp_path / 'out.jsonl')
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_export_insights_resume(tmp_path, processes):
+    with pytest.raises(KeyboardInterrupt):
+        _export(_mock_logs_client(fail_on_window=3), tmp_path, resume=False, processes=processes)
+    assert _read_out(tmp_path) == [{'start': i} for i in (0, 10, 20)]
+
+    # simulate a partially written window
+    with open(tmp_path / 'out.jsonl', 'a') as f:
+        f.write('{"start": 3')
+
+    logs_client = _mock_logs_client()
+    # the time range comes from the manifest, not the arguments
+    assert _export(logs_client, tmp_path, resume=True, start_time=1000, end_time=2000, processes=processes) == 5
+    assert logs_client.started == [(30, 39), (40, 49)]
+    assert _read_out(tmp_path) == [{'start': i} for i in (0, 10, 20, 30, 40)]
+
+
+def test_export_insights_no_resume_starts_over(tmp_path):
+    with pytest.raises(KeyboardInterrupt):
+        _export(_mock_logs_client(fail_on_window=3), tmp_path, resume=False)
+
+    logs_client = _mock_logs_client()
+    assert _export(logs_client, tmp_path, resume=False) == 5
+    assert len(logs_client.started) == 5
+    assert _read_out(tmp_path) == [{'start': i} for i in (0, 10, 20, 30, 40)]
+
+
+@pytest.mark.parametrize('changed,field_name', [
+    ({'query': 'some other query'}, 'query'),
+    ({'typed': True}, 'typed'),
+])
+def test_export_insights_resume_mismatch(tmp_path, changed, field_name):
+    _export(_mock_logs_client(), tmp_path, resume=False)
+    with pytest.raises(CheckpointMismatchException) as exc_info:
+        Insights(_mock_logs_client()).export_insights(**{
+            'query': QUERY,
+            'result_limit': 100,
+            'group_names': GROUP_NAMES,
+            'start_time': 0,
+            'out_file': str(tmp_path / 'out.jsonl'),
+            'checkpoint_dir': str(tmp_path / 'checkpoint'),
+            'resume': True,
+            **changed
+        })
+    assert exc_info.value.field_name == field_name
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_export_insights_truncated_window(tmp_path, processes):
+    with pytest.warns(TruncatedWindowWarning) as warnings_raised:
+        assert _export(_mock_logs_client(), tmp_path, resume=False, processes=processes, result_limit=1) == 5
+    assert len(warnings_raised) == 5, 'Each window hit the limit'
+
+    manifest = load_manifest(str(tmp_path / 'checkpoint'))
+    assert manifest is not None
+    assert all(w.truncated for w in manifest.completed)
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_export_insights_budget_across_windows(tmp_path, processes):
+    with pytest.raises(ScanBudgetExceededException):
+        _export(_mock_logs_client(bytes_scanned=100), tmp_path, resume=False, processes=processes, max_bytes=250)
+    manifest = load_manifest(str(tmp_path / 'checkpoint'))
+    # the third window starts with 50 bytes left, and goes over them
+    assert [w.bytes_scanned for w in manifest.completed] == [100, 100, 100]
+    assert manifest.bytes_scanned == 300
+    assert [r['start'] for r in _read_out(tmp_path)] == [0, 10, 20]
+
+    # windows scanned by the earlier run count against the budget
+    mock_logs_client = _mock_logs_client(bytes_scanned=100)
+    with pytest.raises(ScanBudgetExceededException):
+        _export(mock_logs_client, tmp_path, resume=True, processes=processes, max_bytes=350)
+    assert mock_logs_client.started == [(30, 39)]
+    assert load_manifest(str(tmp_path / 'checkpoint')).bytes_scanned == 400
+
+
+@pytest.mark.parametrize('processes,min_pool_rows,expected_pooled', [(None, 0, 0), (2, 0, 5), (2, 2, 0)])
+def test_export_insights_callback(tmp_path, monkeypatch, processes, min_pool_rows, expected_pooled):
+    pooled = []
+    submit = OrderedProcessPipeline.submit
+
+    def _submit(self, *args):
+        pooled.append(args)
+        submit(self, *args)
+
+    monkeypatch.setattr(OrderedProcessPipeline, 'submit', _submit)
+    mock_logs_client = _mock_logs_client()
+    polls: List[str] = []
+
+    def _get_query_results(queryId: str) -> GenericDict:
+        # each query is still running when it's first polled
+        status = ResponseStatus.COMPLETE if queryId in polls else ResponseStatus.RUNNING
+        polls.append(queryId)
+        return {'status': status, 'results': [[{'field': 'message', 'value': '{"a": 1}'}]]}
+
+    mock_logs_client.get_query_results.side_effect = _get_query_results
+    callback_results = []
+    assert Insights(mock_logs_client).export_insights(
+        query=QUERY, result_limit=100, group_names=GROUP_NAMES, start_time=0, end_time=49,
+        out_file=str(tmp_path / 'out.jsonl'), checkpoint_dir=str(tmp_path / 'checkpoint'), window=10,
+        callback=lambda r: callback_results.append(list(r)), processes=processes, min_pool_rows=min_pool_rows
+    ) == 5
+    assert callback_results == [[{'message': {'a': 1}}]] * 5, 'Callbacks get post-processed rows however they run'
+    assert _read_out(tmp_path) == [{'message': {'a': 1}}] * 5
+    assert len(pooled) == expected_pooled
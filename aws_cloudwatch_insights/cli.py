@@ -1,10 +1,10 @@
 """Console script for aws_cloudwatch_insights."""
+import cProfile
 import os
 from datetime import datetime, timedelta
 from io import StringIO
-from typing import List, Optional, Dict, Any, Iterable, TextIO, cast
+from typing import List, Optional, Dict, Any, Iterable, TextIO, Union, Callable, TYPE_CHECKING, cast
 
-import boto3
 from yaml import Loader
 
 try:
@@ -21,7 +21,18 @@ import re
 import yaml
 import json
 
-from .aws_cloudwatch_insights import GenericDict, CallbackFunction, Insights
+from .cost import parse_bytes
+from .partial import PartialResults, PartialIterator
+from . import daemon
+
+if TYPE_CHECKING:
+    from .aws_cloudwatch_insights import Insights
+    from .typed import Schema
+
+# not imported from aws_cloudwatch_insights.py, which pulls in boto3 and numpy, and a query sent to the daemon needs
+# neither
+GenericDict = Dict[str, Any]
+CallbackFunction = Callable[[Iterable[GenericDict]], Any]
 
 STDOUT_FD = 1
 STDERR_FD = 2
@@ -75,6 +86,16 @@ def _get_time(time_raw) -> int:
             return int((datetime.now() - timedelta(days=-time_float)).timestamp())
 
 
+def _get_duration(duration_raw) -> int:
+    """A duration in seconds, from either a dhms string, a dict of timedelta kwargs or a number of seconds"""
+    if isinstance(duration_raw, str):
+        return int(parse_timedelta(duration_raw).total_seconds())
+    elif isinstance(duration_raw, dict):
+        return int(timedelta(**duration_raw).total_seconds())
+    else:
+        return int(duration_raw)
+
+
 def _get_list_opt(raw_opt, split_with=None):
     if isinstance(raw_opt, str) and split_with is None:
         return [raw_opt]
@@ -110,6 +131,25 @@ class Fields:
     region = 'region'
     quiet = 'quiet'
     groups = 'groups'
+    checkpoint_dir = 'checkpoint_dir'
+    resume = 'resume'
+    window = 'window'
+    typed = 'typed'
+    max_scan = 'max_scan'
+    narrow = 'narrow'
+    timeout = 'timeout'
+    early_exit = 'early_exit'
+    memoize_json = 'memoize_json'
+    bindings = 'bindings'
+    bindings_file = 'bindings_file'
+    binding_mode = 'binding_mode'
+    concurrency = 'concurrency'
+    sort_by = 'sort_by'
+    descending = 'descending'
+    max_memory_rows = 'max_memory_rows'
+    aws_profile = 'aws_profile'
+    role_arn = 'role_arn'
+    processes = 'processes'
 
 
 DEFAULTS = {
@@ -120,6 +160,25 @@ DEFAULTS = {
     Fields.out_file: None,
     Fields.region: None,
     Fields.quiet: False,
+    Fields.checkpoint_dir: None,
+    Fields.resume: False,
+    Fields.window: '1d',
+    Fields.typed: False,
+    Fields.max_scan: None,
+    Fields.narrow: False,
+    Fields.timeout: None,
+    Fields.early_exit: False,
+    Fields.memoize_json: False,
+    Fields.bindings: None,
+    Fields.bindings_file: None,
+    Fields.binding_mode: 'auto',
+    Fields.concurrency: 4,
+    Fields.sort_by: None,
+    Fields.descending: False,
+    Fields.max_memory_rows: 100000,
+    Fields.aws_profile: None,
+    Fields.role_arn: None,
+    Fields.processes: None,
 }
 
 
@@ -152,8 +211,27 @@ def _consolidate_opts(file, kwargs):
 
 
 def _run_acwi(query: str, quiet: bool, result_limit: int, out_file: Optional[str], lambda_group_names: List[str],
-              start_time: int, end_time: int, jsonify: bool, region: Optional[str]) -> None:
-    logs_client = boto3.client('logs', region_name=region)
+              start_time: int, end_time: int, jsonify: bool, region: Optional[str],
+              checkpoint_dir: Optional[str] = None, resume: bool = False, window: int = 86400,
+              socket_path: Optional[str] = None, typed: Union[bool, 'Schema'] = False,
+              max_bytes: Optional[int] = None,
+              narrow: bool = False, dry_run: bool = False, timeout: Optional[int] = None,
+              early_exit: bool = False, memoize_json: bool = False, bindings: Optional[List[str]] = None,
+              binding_mode: str = 'auto', concurrency: int = 4, sort_by: Optional[str] = None,
+              descending: bool = False, max_memory_rows: int = 100000, aws_profile: Optional[str] = None,
+              role_arn: Optional[str] = None, processes: Optional[int] = None) -> None:
+    def _insights() -> 'Insights':
+        # only set up a client once it's needed, since a query sent to the daemon doesn't need one
+        from .aws_cloudwatch_insights import Insights
+        from .clients import get_logs_client
+        return Insights(get_logs_client(region, profile=aws_profile, role_arn=role_arn))
+
+    if dry_run:
+        estimated_bytes = _insights().estimate_scan_bytes(
+            group_names=lambda_group_names, start_time=start_time, end_time=end_time
+        )
+        print(f"Estimated bytes scanned: {estimated_bytes} ({estimated_bytes / 1024 ** 3:.2f} GiB)")
+        return
 
     flipbook: Optional[AsciiFlipbook]
     if not quiet:
@@ -190,6 +268,33 @@ def _run_acwi(query: str, quiet: bool, result_limit: int, out_file: Optional[str
     else:
         callback = None
 
+    if checkpoint_dir is not None:
+        assert out_file is not None
+        try:
+            rows_exported = _insights().export_insights(
+                query=query,
+                result_limit=result_limit,
+                group_names=lambda_group_names,
+                start_time=start_time,
+                end_time=end_time,
+                out_file=out_file,
+                checkpoint_dir=checkpoint_dir,
+                window=window,
+                resume=resume,
+                jsonify=jsonify,
+                typed=typed,
+                max_bytes=max_bytes,
+                memoize_json=memoize_json,
+                processes=processes,
+                callback=callback
+            )
+        finally:
+            if flipbook:
+                flipbook.clear()
+        if not quiet:
+            print(f"Wrote {rows_exported} rows")
+        return
+
     fout: TextIO
     if out_file is not None:
         fout = open(out_file, 'w')
@@ -203,17 +308,72 @@ def _run_acwi(query: str, quiet: bool, result_limit: int, out_file: Optional[str
         results = results_so_far
         raise error
 
+    # sweeps fan out over several queries, and the daemon only has its default credentials, so those always run here.
+    # Queries whose AWS environment variables aren't the daemon's are sent back to run here too
+    use_daemon = bindings is None and aws_profile is None and role_arn is None
+    daemon_sock = daemon.connect(socket_path) if socket_path is not None and use_daemon else None
+
     try:
-        results = Insights(logs_client).get_insights(
-            query=query,
-            result_limit=result_limit,
-            group_names=lambda_group_names,
-            start_time=start_time,
-            end_time=end_time,
-            jsonify=jsonify,
-            callback=callback,
-            error=_handle_error
-        )
+        if bindings is not None:
+            results = _insights().get_insights_sweep(
+                query_template=query,
+                bindings=bindings,
+                result_limit=result_limit,
+                group_names=lambda_group_names,
+                start_time=start_time,
+                end_time=end_time,
+                mode=binding_mode,
+                concurrency=concurrency,
+                sort_by=sort_by,
+                descending=descending,
+                max_memory_rows=max_memory_rows,
+                jsonify=jsonify,
+                typed=typed,
+                max_bytes=max_bytes,
+                narrow=narrow,
+                deadline=timeout,
+                stop_at_limit=early_exit,
+                memoize_json=memoize_json
+            )
+        elif daemon_sock is not None:
+            # a warm daemon is running, so let it do the work
+            try:
+                results = daemon.query_daemon(
+                    daemon_sock,
+                    region=region,
+                    query=query,
+                    result_limit=result_limit,
+                    group_names=lambda_group_names,
+                    start_time=start_time,
+                    end_time=end_time,
+                    jsonify=jsonify,
+                    typed=typed,
+                    max_bytes=max_bytes,
+                    narrow=narrow,
+                    deadline=timeout,
+                    stop_at_limit=early_exit,
+                    memoize_json=memoize_json
+                )
+            except daemon.DaemonEnvironmentException:
+                # it was started with other AWS credentials, profile or region, so the query has to run here
+                daemon_sock = None
+        if bindings is None and daemon_sock is None:
+            results = _insights().get_insights(
+                query=query,
+                result_limit=result_limit,
+                group_names=lambda_group_names,
+                start_time=start_time,
+                end_time=end_time,
+                jsonify=jsonify,
+                typed=typed,
+                max_bytes=max_bytes,
+                narrow=narrow,
+                deadline=timeout,
+                stop_at_limit=early_exit,
+                memoize_json=memoize_json,
+                callback=callback,
+                error=_handle_error
+            )
     finally:
         if flipbook:
             flipbook.clear()
@@ -221,11 +381,13 @@ def _run_acwi(query: str, quiet: bool, result_limit: int, out_file: Optional[str
         try:
             if fout:
                 for row in results:
-                    print(json.dumps(row), file=fout)
+                    print(json.dumps(row, default=str), file=fout)
                     rows_written += 1
         finally:
             if fout is not sys.stdout:
                 fout.close()
+        if not quiet and isinstance(results, (PartialResults, PartialIterator)):
+            print(f"Query was stopped early ({results.reason}), results are partial", file=sys.stderr)
         if not quiet and (
             fout is not sys.stdout
             # if stdout is being piped somewhere but stderr is still a tty
@@ -235,7 +397,7 @@ def _run_acwi(query: str, quiet: bool, result_limit: int, out_file: Optional[str
 
 
 @click.command()
-@click.argument('file')
+@click.argument('file', required=False)
 @click.option('--limit', '-l', help=f"The maximum number or items returned. Default {DEFAULTS[Fields.limit]!r}."
                                     f" Yaml file field: {Fields.limit!r}")
 @click.option('--start', '-s', help=f"Earliest record the query will search for.  Can be an integer timestamp, an iso"
@@ -248,21 +410,98 @@ def _run_acwi(query: str, quiet: bool, result_limit: int, out_file: Optional[str
               help=f"When true, attempts to parse fields that look like they might be json object into a json"
                    f" structure. If it can't parse the fields, leaves them as string.  Default:"
                    f" {DEFAULTS[Fields.jsonify]!r}.  Yaml file field: {Fields.jsonify!r}")
+@click.option('--typed/--no-typed', default=None,
+              help=f"When true, converts @timestamp to epoch milliseconds and numeric looking fields to numbers.  In"
+                   f" the yaml file, can instead be a mapping of field names to types (timestamp, datetime, int, float"
+                   f" or str).  Default: {DEFAULTS[Fields.typed]!r}.  Yaml file field: {Fields.typed!r}")
+@click.option('--max-scan', help=f"A budget for the bytes the query scans, eg '500MB' or '2GB'.  The query is refused"
+                                 f" if it's estimated to scan more, and stopped if it actually does.  Default: no"
+                                 f" budget.  Yaml file field: {Fields.max_scan!r}")
+@click.option('--narrow/--no-narrow', default=None,
+              help=f"With --max-scan, instead of refusing a query estimated to be over budget, move its start time"
+                   f" later until it fits.  Default: {DEFAULTS[Fields.narrow]!r}.  Yaml file field: {Fields.narrow!r}")
+@click.option('--timeout', '-t', help=f"If the query hasn't completed after this long, stop it and output the partial"
+                                      f" results so far.  In dhms, eg '30s' or '5m'.  Default: no timeout.  Yaml file"
+                                      f" field: {Fields.timeout!r}")
+@click.option('--early-exit/--no-early-exit', default=None,
+              help=f"Stop the query as soon as its partial results reach the limit.  Ignored for queries that sort or"
+                   f" use stats.  Default: {DEFAULTS[Fields.early_exit]!r}.  Yaml file field: {Fields.early_exit!r}")
+@click.option('--profile', 'profile_file',
+              help="If included, profiles the run with cProfile and writes the stats to this file, which can be read"
+                   " with `python -m pstats` or tools like snakeviz")
+@click.option('--dry-run', is_flag=True, default=False,
+              help="Print an estimate of the bytes the query would scan, without running it")
+@click.option('--memoize-json/--no-memoize-json', default=None,
+              help=f"With --jsonify, cache parsed json and share repeated keys and values, which is faster and uses"
+                   f" less memory for logs with many repeated payloads.  Default:"
+                   f" {DEFAULTS[Fields.memoize_json]!r}.  Yaml file field: {Fields.memoize_json!r}")
+@click.option('--bindings', '-b', help=f"A comma delimited list of values to run the query with.  The query is then a"
+                                       f" template with a ${{name}} placeholder, eg `filter requestId = ${{id}}`, and"
+                                       f" each row gets the binding it came from as `@binding`.  Default: no bindings."
+                                       f"  Yaml file field: {Fields.bindings!r}")
+@click.option('--bindings-file', help=f"A file with a binding per line, used like --bindings.  Yaml file field:"
+                                      f" {Fields.bindings_file!r}")
+@click.option('--binding-mode', type=click.Choice(['auto', 'pack', 'fanout']),
+              help=f"With bindings, 'pack' substitutes many bindings into each query, which needs the placeholder to"
+                   f" be used as `field in ${{name}}`.  'fanout' runs a query per binding.  'auto' packs when it can."
+                   f"  Default: {DEFAULTS[Fields.binding_mode]!r}.  Yaml file field: {Fields.binding_mode!r}")
+@click.option('--concurrency', '-c', type=int,
+              help=f"With bindings, how many queries to run at once.  Default: {DEFAULTS[Fields.concurrency]!r}.  Yaml"
+                   f" file field: {Fields.concurrency!r}")
+@click.option('--sort-by', help=f"With bindings, merge the rows of all the queries sorted on this field.  Rows are"
+                                f" spilled to temporary files when there are too many to hold in memory.  Default:"
+                                f" rows are in the order of the bindings.  Yaml file field: {Fields.sort_by!r}")
+@click.option('--descending/--ascending', default=None,
+              help=f"With --sort-by, the sort order.  Default: ascending.  Yaml file field: {Fields.descending!r}")
+@click.option('--max-memory-rows', type=int,
+              help=f"With --sort-by, the most rows held in memory before spilling to disk.  Default:"
+                   f" {DEFAULTS[Fields.max_memory_rows]!r}.  Yaml file field: {Fields.max_memory_rows!r}")
+@click.option('--processes', '-p', type=int,
+              help=f"With --checkpoint-dir, decodes each window's results on a pool of this many processes (0 for one"
+                   f" per CPU) while the next window's query runs.  Default: decoded in-process.  Yaml file field:"
+                   f" {Fields.processes!r}")
 @click.option('--groups', '--group', '-g', help=f"A comma delimited list of the log groups to search through.  No"
                                                 f" Default.  Yaml file field: {Fields.groups!r}")
 @click.option('--out-file', '--out', '-o', help=f"If included, outputs results to stated file.  Default is standard"
                                                 f" out.  Yaml file field: {Fields.out_file!r}")
 @click.option('--region', '-r', help=f"AWS Region.  If excluded, uses system default.  Yaml file field:"
                                      f" {Fields.region!r}")
+@click.option('--aws-profile', help=f"The AWS profile to use.  If excluded, uses the system default.  Yaml file field:"
+                                    f" {Fields.aws_profile!r}")
+@click.option('--role-arn', help=f"If included, assumes this IAM role for the queries, refreshing its credentials"
+                                 f" before they expire.  Yaml file field: {Fields.role_arn!r}")
 @click.option('--quiet/--not-quiet', '-q/-Q', help=f"If true, will not give status outputs to standard error.  Default"
                                                    f" is {DEFAULTS[Fields.quiet]}.  Yaml file field: {Fields.quiet!r}")
-def main(file, **kwargs):
+@click.option('--checkpoint-dir', help=f"If included, splits the query's time range into windows and records each"
+                                       f" finished window in this directory, so the export can be resumed.  Requires"
+                                       f" --out-file.  Yaml file field: {Fields.checkpoint_dir!r}")
+@click.option('--resume/--no-resume', default=None,
+              help=f"With --checkpoint-dir, skips the windows already completed by an earlier run and continues where"
+                   f" it stopped.  Default: {DEFAULTS[Fields.resume]!r}.  Yaml file field: {Fields.resume!r}")
+@click.option('--window', '-w', help=f"With --checkpoint-dir, the length of each window in dhms: '6h', '1d'.  Default:"
+                                     f" {DEFAULTS[Fields.window]!r}.  Yaml file field: {Fields.window!r}")
+@click.option('--serve', is_flag=True, default=False,
+              help="Instead of running a query, start a long-lived daemon which keeps AWS clients warm and runs the"
+                   " queries of other `acwi` calls, which send them to it over a unix socket")
+@click.option('--socket', 'socket_path', help="The unix socket for the daemon.  Default: the ACWI_SOCKET environment"
+                                              " variable, or acwi.sock in $XDG_RUNTIME_DIR (or else a private"
+                                              " directory in the temp dir)")
+@click.option('--daemon/--no-daemon', 'use_daemon', default=True,
+              help="Whether to send the query to a running daemon (see --serve), if there is one.  Default: True")
+def main(file, serve, socket_path, use_daemon, dry_run, profile_file, **kwargs):
     """
     Console script for aws_cloudwatch_insights. FILE is a file either containing just the AWS Insights query or a
      yaml file with a `query` field and other options.
 
     Returns items in a .jsonl format
     """
+    socket_path = socket_path or os.environ.get('ACWI_SOCKET') or daemon.default_socket_path()
+    if serve:
+        daemon.serve(socket_path)
+        return 0
+    if file is None:
+        raise click.UsageError("Missing argument 'FILE'.")
+
     opts = _consolidate_opts(file, kwargs)
 
     query = opts[Fields.query]
@@ -282,17 +521,79 @@ def main(file, **kwargs):
 
     region = opts[Fields.region]
 
-    _run_acwi(
-        query,
-        quiet=quiet,
-        result_limit=result_limit,
-        out_file=out_file,
-        lambda_group_names=lambda_group_names,
-        start_time=start_time,
-        end_time=end_time,
-        jsonify=jsonify,
-        region=region
-    )
+    checkpoint_dir = opts[Fields.checkpoint_dir]
+    if checkpoint_dir is not None and out_file is None:
+        raise click.UsageError('--checkpoint-dir requires --out-file')
+    resume = bool(opts[Fields.resume])
+    window = _get_duration(opts[Fields.window])
+    typed = opts[Fields.typed]
+    max_bytes = parse_bytes(opts[Fields.max_scan]) if opts[Fields.max_scan] is not None else None
+    narrow = bool(opts[Fields.narrow])
+    timeout = _get_duration(opts[Fields.timeout]) if opts[Fields.timeout] is not None else None
+    early_exit = bool(opts[Fields.early_exit])
+    memoize_json = bool(opts[Fields.memoize_json])
+
+    bindings: Optional[List[str]] = None
+    if opts[Fields.bindings] is not None or opts[Fields.bindings_file] is not None:
+        bindings = list(_get_list_opt(opts[Fields.bindings], split_with=',') or [])
+        if opts[Fields.bindings_file] is not None:
+            with open(opts[Fields.bindings_file], 'r') as fin:
+                bindings += [line.strip() for line in fin if line.strip()]
+    binding_mode = opts[Fields.binding_mode]
+    concurrency = int(opts[Fields.concurrency])
+    sort_by = opts[Fields.sort_by]
+    descending = bool(opts[Fields.descending])
+    max_memory_rows = int(opts[Fields.max_memory_rows])
+    aws_profile = opts[Fields.aws_profile]
+    role_arn = opts[Fields.role_arn]
+    processes = int(opts[Fields.processes]) if opts[Fields.processes] is not None else None
+    if processes is not None and checkpoint_dir is None:
+        raise click.UsageError('--processes requires --checkpoint-dir')
+    if checkpoint_dir is not None:
+        # exports run every window to completion, so these would be silently ignored
+        for option, is_set in (('--timeout', timeout is not None), ('--early-exit', early_exit), ('--narrow', narrow)):
+            if is_set:
+                raise click.UsageError(f"{option} can't be used with --checkpoint-dir")
+
+    profiler = cProfile.Profile() if profile_file else None
+    if profiler:
+        profiler.enable()
+    try:
+        _run_acwi(
+            query,
+            quiet=quiet,
+            result_limit=result_limit,
+            out_file=out_file,
+            lambda_group_names=lambda_group_names,
+            start_time=start_time,
+            end_time=end_time,
+            jsonify=jsonify,
+            region=region,
+            checkpoint_dir=checkpoint_dir,
+            resume=resume,
+            window=window,
+            socket_path=socket_path if use_daemon else None,
+            typed=typed,
+            max_bytes=max_bytes,
+            narrow=narrow,
+            dry_run=dry_run,
+            timeout=timeout,
+            early_exit=early_exit,
+            memoize_json=memoize_json,
+            bindings=bindings,
+            binding_mode=binding_mode,
+            concurrency=concurrency,
+            sort_by=sort_by,
+            descending=descending,
+            max_memory_rows=max_memory_rows,
+            aws_profile=aws_profile,
+            role_arn=role_arn,
+            processes=processes
+        )
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
 
     return 0
 
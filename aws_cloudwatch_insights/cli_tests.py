@@ -1,7 +1,10 @@
 import os.path
 import re
+import subprocess
+import sys
 from datetime import datetime, timedelta, timezone
-from unittest.mock import create_autospec, call, ANY
+import threading
+from unittest.mock import create_autospec, call, ANY, MagicMock
 
 import pytest
 from freezegun import freeze_time
@@ -10,7 +13,7 @@ cli_modules_loaded = False
 
 try:
     from click.testing import CliRunner
-    from aws_cloudwatch_insights import cli
+    from aws_cloudwatch_insights import cli, clients
     cli_modules_loaded = True
 except ModuleNotFoundError:
     # none of the tests here should be run if this fails
@@ -35,6 +38,14 @@ def test_cli_modules_loaded():
                                ' (ie run `pip install -e \'.[cli]\'`)'
 
 
+@pytest.mark.cli
+def test_cli_import_is_light():
+    # a query sent to the daemon needs neither, and they're most of the cli's start up time
+    code = 'import sys, aws_cloudwatch_insights.cli; print(sorted({"boto3", "numpy"} & set(sys.modules)))'
+    output = subprocess.run([sys.executable, '-c', code], cwd=PROJECT_ROOT, check=True, stdout=subprocess.PIPE)
+    assert output.stdout.decode().strip() == '[]'
+
+
 @pytest.mark.cli
 def test_command_line_interface_basic():
     """
@@ -69,7 +80,11 @@ EXPECTED_CALLS = [call(
     end_time=int(NOW.timestamp()), start_time=int((NOW - timedelta(days=30)).timestamp()),
     lambda_group_names=['/aws/lambda/log_maker_a', '/aws/lambda/log_maker_b'], result_limit=139,
     out_file='results.json', region='us-west-2',
-    quiet=False, jsonify=True
+    quiet=False, jsonify=True, checkpoint_dir=None, resume=False, window=86400,
+    socket_path=ANY, typed=False, max_bytes=None, narrow=False, dry_run=False,
+    timeout=None, early_exit=False, memoize_json=False, bindings=None, binding_mode='auto', concurrency=4,
+    sort_by=None, descending=False, max_memory_rows=100000, aws_profile=None, role_arn=None,
+    processes=None
 )]
 CLI_ARGS_YAML = ['--region', 'us-east-2', os.path.join(PROJECT_ROOT, 'test-assets', 'acwi.yml'), '--out',
                  'results.json']
@@ -77,7 +92,11 @@ EXPECTED_CALLS_YAML = [call(
     QUERY_YAML,
     end_time=int(NOW.timestamp()), start_time=int(datetime(1990, 1, 1, tzinfo=timezone.utc).timestamp()),
     lambda_group_names=['/aws/lambda/a', '/aws/lambda/c'], result_limit=30, out_file=ANY, region='us-east-2',
-    quiet=False, jsonify=True
+    quiet=False, jsonify=True, checkpoint_dir=None, resume=False, window=86400,
+    socket_path=ANY, typed=False, max_bytes=None, narrow=False, dry_run=False,
+    timeout=None, early_exit=False, memoize_json=False, bindings=None, binding_mode='auto', concurrency=4,
+    sort_by=None, descending=False, max_memory_rows=100000, aws_profile=None, role_arn=None,
+    processes=None
 )]
 
 
@@ -95,3 +114,194 @@ def test_command_line_interface(monkeypatch, cli_args, expected_calls):
         result = runner.invoke(cli.main, cli_args)
     assert result.exit_code == 0
     assert mock_run_acwi.call_args_list == expected_calls
+
+
+@pytest.mark.cli
+def test_command_line_interface_checkpoint(monkeypatch):
+    mock_run_acwi = create_autospec(cli._run_acwi)
+    monkeypatch.setattr(cli, '_run_acwi', mock_run_acwi)
+
+    runner = CliRunner()
+    with freeze_time(NOW):
+        result = runner.invoke(cli.main, [*CLI_ARGS, '--checkpoint-dir', 'checkpoint', '--resume', '--window', '6h'])
+    assert result.exit_code == 0
+    assert mock_run_acwi.call_args_list == [call(
+        QUERY,
+        end_time=int(NOW.timestamp()), start_time=int((NOW - timedelta(days=30)).timestamp()),
+        lambda_group_names=['/aws/lambda/log_maker_a', '/aws/lambda/log_maker_b'], result_limit=139,
+        out_file='results.json', region='us-west-2',
+        quiet=False, jsonify=True, checkpoint_dir='checkpoint', resume=True, window=6 * 60 * 60,
+        socket_path=ANY, typed=False, max_bytes=None, narrow=False, dry_run=False,
+        timeout=None, early_exit=False, memoize_json=False, bindings=None, binding_mode='auto', concurrency=4,
+        sort_by=None, descending=False, max_memory_rows=100000, aws_profile=None, role_arn=None,
+        processes=None
+    )]
+
+
+@pytest.mark.cli
+def test_command_line_interface_checkpoint_requires_out_file(monkeypatch):
+    mock_run_acwi = create_autospec(cli._run_acwi)
+    monkeypatch.setattr(cli, '_run_acwi', mock_run_acwi)
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [
+        '--group', '/aws/lambda/log_maker_a', os.path.join(PROJECT_ROOT, 'test-assets', 'acwi.acwi'),
+        '--checkpoint-dir', 'checkpoint'
+    ])
+    assert result.exit_code == 2
+    assert mock_run_acwi.call_args_list == []
+
+
+@pytest.mark.cli
+@pytest.mark.parametrize('extra_args', [['--timeout', '30s'], ['--early-exit'], ['--narrow']])
+def test_command_line_interface_checkpoint_unsupported(monkeypatch, extra_args):
+    mock_run_acwi = create_autospec(cli._run_acwi)
+    monkeypatch.setattr(cli, '_run_acwi', mock_run_acwi)
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [*CLI_ARGS, '--checkpoint-dir', 'checkpoint', *extra_args])
+    assert result.exit_code == 2
+    assert extra_args[0] in result.output
+    assert mock_run_acwi.call_args_list == []
+
+
+@pytest.mark.cli
+def test_command_line_interface_processes_requires_checkpoint(monkeypatch):
+    mock_run_acwi = create_autospec(cli._run_acwi)
+    monkeypatch.setattr(cli, '_run_acwi', mock_run_acwi)
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [*CLI_ARGS, '--processes', '2'])
+    assert result.exit_code == 2
+    assert mock_run_acwi.call_args_list == []
+
+
+@pytest.mark.cli
+@pytest.mark.parametrize('extra_args,env_socket,expected_socket_path', [
+    ([], None, 'default'),
+    ([], '/tmp/env.sock', '/tmp/env.sock'),
+    (['--socket', '/tmp/cli.sock'], '/tmp/env.sock', '/tmp/cli.sock'),
+    (['--no-daemon'], None, None),
+])
+def test_command_line_interface_daemon_socket(monkeypatch, extra_args, env_socket, expected_socket_path):
+    mock_run_acwi = create_autospec(cli._run_acwi)
+    monkeypatch.setattr(cli, '_run_acwi', mock_run_acwi)
+    if env_socket is None:
+        monkeypatch.delenv('ACWI_SOCKET', raising=False)
+    else:
+        monkeypatch.setenv('ACWI_SOCKET', env_socket)
+    if expected_socket_path == 'default':
+        expected_socket_path = cli.daemon.default_socket_path()
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [*CLI_ARGS, *extra_args])
+    assert result.exit_code == 0
+    assert len(mock_run_acwi.call_args_list) == 1
+    assert mock_run_acwi.call_args_list[0].kwargs['socket_path'] == expected_socket_path
+
+
+@pytest.mark.cli
+@pytest.mark.parametrize('aws_profile,expected_source', [(None, 'daemon'), ('prod', 'in-process')])
+def test_run_acwi_daemon_aws_environment(monkeypatch, tmp_path, aws_profile, expected_source):
+    def _logs_client(source: str) -> MagicMock:
+        mock_logs_client = MagicMock()
+        mock_logs_client.start_query.return_value = {'queryId': 'fake-query-id'}
+        mock_logs_client.get_query_results.return_value = {
+            'status': 'Complete', 'results': [[{'field': 'source', 'value': source}]]
+        }
+        return mock_logs_client
+
+    monkeypatch.delenv('AWS_PROFILE', raising=False)
+    socket_path = str(tmp_path / 'acwi.sock')
+    daemon = cli.daemon.InsightsDaemon(socket_path, logs_client_factory=lambda _: _logs_client('daemon'))
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(clients, 'get_logs_client', lambda *_, **__: _logs_client('in-process'))
+    if aws_profile is not None:
+        monkeypatch.setenv('AWS_PROFILE', aws_profile)
+    out_file = tmp_path / 'out.jsonl'
+    try:
+        cli._run_acwi(
+            QUERY, quiet=True, result_limit=10, out_file=str(out_file), lambda_group_names=['/aws/lambda/a'],
+            start_time=0, end_time=100, jsonify=True, region=None, socket_path=socket_path
+        )
+    finally:
+        daemon.shutdown()
+        daemon.server_close()
+        thread.join()
+    assert out_file.read_text() == f'{{"source": "{expected_source}"}}\n', \
+        "Queries with another AWS environment than the daemon's run in-process"
+
+
+@pytest.mark.cli
+def test_command_line_interface_serve(monkeypatch):
+    mock_serve = create_autospec(cli.daemon.serve)
+    monkeypatch.setattr(cli.daemon, 'serve', mock_serve)
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ['--serve', '--socket', '/tmp/acwi-test.sock'])
+    assert result.exit_code == 0
+    assert mock_serve.call_args_list == [call('/tmp/acwi-test.sock')]
+
+
+@pytest.mark.cli
+def test_command_line_interface_max_scan(monkeypatch):
+    mock_run_acwi = create_autospec(cli._run_acwi)
+    monkeypatch.setattr(cli, '_run_acwi', mock_run_acwi)
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [*CLI_ARGS, '--max-scan', '2GB', '--narrow', '--dry-run'])
+    assert result.exit_code == 0
+    [(_, actual_kwargs)] = mock_run_acwi.call_args_list
+    assert actual_kwargs['max_bytes'] == 2 * 1024 ** 3
+    assert actual_kwargs['narrow'] is True
+    assert actual_kwargs['dry_run'] is True
+
+
+@pytest.mark.cli
+def test_command_line_interface_timeout(monkeypatch):
+    mock_run_acwi = create_autospec(cli._run_acwi)
+    monkeypatch.setattr(cli, '_run_acwi', mock_run_acwi)
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [*CLI_ARGS, '--timeout', '2m', '--early-exit'])
+    assert result.exit_code == 0
+    [(_, actual_kwargs)] = mock_run_acwi.call_args_list
+    assert actual_kwargs['timeout'] == 120
+    assert actual_kwargs['early_exit'] is True
+
+
+@pytest.mark.cli
+def test_command_line_interface_profile(monkeypatch, tmp_path):
+    mock_run_acwi = create_autospec(cli._run_acwi)
+    monkeypatch.setattr(cli, '_run_acwi', mock_run_acwi)
+    profile_file = str(tmp_path / 'acwi.prof')
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [*CLI_ARGS, '--profile', profile_file])
+    assert result.exit_code == 0
+    assert len(mock_run_acwi.call_args_list) == 1
+    assert os.path.getsize(profile_file) > 0
+
+
+@pytest.mark.cli
+def test_command_line_interface_bindings(monkeypatch, tmp_path):
+    mock_run_acwi = create_autospec(cli._run_acwi)
+    monkeypatch.setattr(cli, '_run_acwi', mock_run_acwi)
+    bindings_file = tmp_path / 'bindings.txt'
+    bindings_file.write_text("id-3\n\nid-4\n")
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [
+        *CLI_ARGS, '--bindings', 'id-1,id-2', '--bindings-file', str(bindings_file), '--binding-mode', 'fanout',
+        '-c', 8,
+        '--sort-by', '@timestamp', '--descending', '--max-memory-rows', 5000
+    ])
+    assert result.exit_code == 0
+    [(_, actual_kwargs)] = mock_run_acwi.call_args_list
+    assert actual_kwargs['bindings'] == ['id-1', 'id-2', 'id-3', 'id-4']
+    assert actual_kwargs['binding_mode'] == 'fanout'
+    assert actual_kwargs['concurrency'] == 8
+    assert actual_kwargs['sort_by'] == '@timestamp'
+    assert actual_kwargs['descending'] is True
+    assert actual_kwargs['max_memory_rows'] == 5000
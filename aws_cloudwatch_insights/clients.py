@@ -0,0 +1,105 @@
+"""Sharing boto3 logs clients, with their connection pools and credentials, across Insights instances."""
+import threading
+from functools import partial
+from typing import Optional, Dict, Tuple, Any
+
+import boto3
+from botocore.config import Config
+from botocore.credentials import AssumeRoleCredentialFetcher, CredentialProvider, CredentialResolver, \
+    DeferredRefreshableCredentials
+from botocore.session import get_session
+
+try:
+    from mypy_boto3_logs import CloudWatchLogsClient
+except ModuleNotFoundError:
+    # don't want to make stubs required
+    CloudWatchLogsClient = Any  # type: ignore
+
+ClientKey = Tuple[Optional[str], Optional[str], Optional[str]]
+
+
+class _AssumedRoleProvider(CredentialProvider):
+    METHOD = 'assume-role'
+    CANONICAL_NAME = 'custom-assume-role'
+
+    def __init__(self, fetcher: AssumeRoleCredentialFetcher):
+        super().__init__()
+        self._fetcher = fetcher
+
+    def load(self) -> DeferredRefreshableCredentials:
+        return DeferredRefreshableCredentials(refresh_using=self._fetcher.fetch_credentials, method=self.METHOD)
+
+
+class ClientRegistry:
+    def __init__(self, max_pool_connections: int = 50, tcp_keepalive: bool = True,
+                 role_session_name: str = 'aws-cloudwatch-insights', role_duration_seconds: int = 60 * 60):
+        """
+        Hands out one logs client per region, profile and role, so every Insights instance using the same ones shares
+        a client, its connection pool and its credentials, rather than resolving credentials and opening new
+        connections each time.  Safe to use from several threads.
+
+        max_pool_connections: The size of each client's connection pool.  botocore's default of 10 is easily used up
+          by concurrent queries.  Default: 50
+        tcp_keepalive: Whether to keep idle connections alive, so they can be reused instead of re-doing the TLS
+          handshake.  Default: True
+        role_session_name: The session name used when assuming a role
+        role_duration_seconds: How long assumed role credentials last.  They're refreshed before they expire.
+          Default: 1 hour
+        """
+        self.max_pool_connections = max_pool_connections
+        self.tcp_keepalive = tcp_keepalive
+        self.role_session_name = role_session_name
+        self.role_duration_seconds = role_duration_seconds
+        self._clients: Dict[ClientKey, CloudWatchLogsClient] = {}
+        self._lock = threading.Lock()
+
+    def _config(self) -> Config:
+        return Config(max_pool_connections=self.max_pool_connections, tcp_keepalive=self.tcp_keepalive)
+
+    def _session(self, region: Optional[str], profile: Optional[str], role_arn: Optional[str]) -> boto3.Session:
+        # without a profile, use boto3's default session, so whatever it's been set up with (eg its region) applies
+        base_session = boto3._get_default_session() if profile is None else boto3.Session(profile_name=profile)
+        if role_arn is None:
+            # boto3's own credential providers already refresh credentials that expire, eg from SSO or instance roles
+            return base_session
+
+        fetcher = AssumeRoleCredentialFetcher(
+            client_creator=partial(base_session.client, region_name=region),
+            source_credentials=base_session.get_credentials(),
+            role_arn=role_arn,
+            extra_args={'RoleSessionName': self.role_session_name, 'DurationSeconds': self.role_duration_seconds}
+        )
+        botocore_session = get_session()
+        if profile is not None:
+            botocore_session.set_config_variable('profile', profile)
+        if base_session.region_name is not None:
+            botocore_session.set_config_variable('region', base_session.region_name)
+        # assumed the first time they're used, then refreshed in the background of calls once they're close to
+        # expiring, so a long run never sees them lapse
+        botocore_session.register_component('credential_provider', CredentialResolver([_AssumedRoleProvider(fetcher)]))
+        return boto3.Session(botocore_session=botocore_session)
+
+    def client(self, region: Optional[str] = None, profile: Optional[str] = None,
+               role_arn: Optional[str] = None) -> CloudWatchLogsClient:
+        """The logs client for this region, profile and role to assume, created the first time it's asked for"""
+        key = (region, profile, role_arn)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                session = self._session(region, profile, role_arn)
+                client = session.client('logs', region_name=region, config=self._config())
+                self._clients[key] = client
+            return client
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+
+default_registry = ClientRegistry()
+
+
+def get_logs_client(region: Optional[str] = None, profile: Optional[str] = None,
+                    role_arn: Optional[str] = None) -> CloudWatchLogsClient:
+    """A shared logs client from the default registry"""
+    return default_registry.client(region=region, profile=profile, role_arn=role_arn)
@@ -0,0 +1,90 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+
+from aws_cloudwatch_insights.clients import ClientRegistry
+
+
+@pytest.fixture
+def aws_env(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+
+
+def test_client_registry(aws_env):
+    registry = ClientRegistry(max_pool_connections=25, tcp_keepalive=True)
+    client = registry.client('us-west-2')
+    assert registry.client('us-west-2') is client
+    assert registry.client('us-east-2') is not client
+    assert client.meta.region_name == 'us-west-2'
+    assert client.meta.config.max_pool_connections == 25
+    assert client.meta.config.tcp_keepalive is True
+
+    registry.clear()
+    assert registry.client('us-west-2') is not client
+
+
+def test_client_registry_default_session(aws_env, monkeypatch):
+    monkeypatch.delenv('AWS_DEFAULT_REGION')
+    monkeypatch.setattr(boto3, 'DEFAULT_SESSION', boto3.Session(region_name='eu-west-1'))
+    assert ClientRegistry().client().meta.region_name == 'eu-west-1'
+
+
+def test_client_registry_threads(aws_env):
+    registry = ClientRegistry()
+    clients = []
+
+    def _get_client():
+        clients.append(registry.client('us-west-2'))
+
+    threads = [threading.Thread(target=_get_client) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(clients) == 8
+    assert all(client is clients[0] for client in clients)
+
+
+def test_client_registry_role(aws_env, monkeypatch):
+    mock_sts = MagicMock()
+    expirations = [
+        # close enough to expiring that it's refreshed the first time it's used
+        datetime.now(timezone.utc) + timedelta(minutes=5),
+        datetime.now(timezone.utc) + timedelta(hours=1),
+    ]
+
+    def _assume_role(**_):
+        return {'Credentials': {
+            'AccessKeyId': f"key-{mock_sts.assume_role.call_count}",
+            'SecretAccessKey': 'secret',
+            'SessionToken': 'token',
+            'Expiration': expirations[mock_sts.assume_role.call_count - 1],
+        }}
+
+    mock_sts.assume_role.side_effect = _assume_role
+    session_client = boto3.Session.client
+    monkeypatch.setattr(
+        boto3.Session, 'client',
+        lambda self, service, **kwargs: mock_sts if service == 'sts' else session_client(self, service, **kwargs)
+    )
+
+    registry = ClientRegistry(role_session_name='test-session')
+    client = registry.client('us-west-2', role_arn='arn:aws:iam::123456789012:role/reader')
+    assert registry.client('us-west-2', role_arn='arn:aws:iam::123456789012:role/reader') is client
+    assert registry.client('us-west-2') is not client
+    assert mock_sts.assume_role.call_count == 0, 'The role is only assumed once the credentials are used'
+
+    credentials = client._request_signer._credentials
+    assert credentials.get_frozen_credentials().access_key == 'key-1'
+    assert mock_sts.assume_role.call_count == 1
+    _, assume_role_kwargs = mock_sts.assume_role.call_args
+    assert assume_role_kwargs['RoleArn'] == 'arn:aws:iam::123456789012:role/reader'
+    assert assume_role_kwargs['RoleSessionName'] == 'test-session'
+
+    assert credentials.get_frozen_credentials().access_key == 'key-2', 'Credentials about to expire are refreshed'
+    assert mock_sts.assume_role.call_count == 2
@@ -0,0 +1,115 @@
+"""Estimating how many bytes a query will scan, so it can be refused or narrowed before it runs."""
+import time
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Tuple, Any
+
+_SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class ScanBudgetExceededException(Exception):
+    def __init__(self, scan_bytes: int, max_bytes: int, estimated: bool):
+        if estimated:
+            message = f"Query is estimated to scan {scan_bytes} bytes, more than the budget of {max_bytes}"
+        else:
+            message = f"Query has scanned {scan_bytes} bytes, more than the budget of {max_bytes}"
+        super().__init__(message)
+        self.scan_bytes = scan_bytes
+        self.max_bytes = max_bytes
+        self.estimated = estimated
+
+
+@dataclass
+class LogGroupInfo:
+    name: str
+    stored_bytes: int
+    creation_time: int  # seconds since the epoch
+    retention_days: Optional[int] = None
+
+    def data_span(self, now: int) -> Tuple[int, int]:
+        """The time range this group can still hold events for"""
+        oldest = self.creation_time
+        if self.retention_days is not None:
+            oldest = max(oldest, now - self.retention_days * _SECONDS_PER_DAY)
+        return oldest, now
+
+    def estimate_bytes(self, start_time: int, end_time: int, now: int) -> int:
+        """Assumes the group's stored bytes are spread evenly across its data span"""
+        span_start, span_end = self.data_span(now)
+        overlap = min(end_time, span_end) - max(start_time, span_start)
+        if overlap <= 0:
+            return 0
+        span = max(span_end - span_start, 1)
+        return int(self.stored_bytes * min(overlap / span, 1.0))
+
+
+class ScanEstimator:
+    def __init__(self, logs_client: Any, cache_seconds: int = 60 * 60):
+        """
+        Estimates the bytes a query will scan from the log groups' `storedBytes` and retention, as returned by
+        describe_log_groups.  Group descriptions are cached for `cache_seconds`.
+
+        This is a rough estimate: it assumes events are spread evenly over time, and stored bytes aren't exactly the
+        bytes Insights bills for
+        """
+        self.logs_client = logs_client
+        self.cache_seconds = cache_seconds
+        self._cache: Dict[str, Tuple[float, LogGroupInfo]] = {}
+
+    def _describe_log_group(self, group_name: str) -> LogGroupInfo:
+        paginator = self.logs_client.get_paginator('describe_log_groups')
+        for page in paginator.paginate(logGroupNamePrefix=group_name):
+            for group in page.get('logGroups', []):
+                if group['logGroupName'] == group_name:
+                    return LogGroupInfo(
+                        name=group_name,
+                        stored_bytes=group.get('storedBytes', 0),
+                        creation_time=group.get('creationTime', 0) // 1000,
+                        retention_days=group.get('retentionInDays')
+                    )
+        # doesn't exist, so Insights won't scan anything in it
+        return LogGroupInfo(name=group_name, stored_bytes=0, creation_time=0)
+
+    def log_group_info(self, group_names: List[str]) -> List[LogGroupInfo]:
+        infos = []
+        for group_name in group_names:
+            cached = self._cache.get(group_name)
+            if cached is None or time.monotonic() - cached[0] > self.cache_seconds:
+                cached = (time.monotonic(), self._describe_log_group(group_name))
+                self._cache[group_name] = cached
+            infos.append(cached[1])
+        return infos
+
+    def estimate_bytes(self, group_names: List[str], start_time: int, end_time: int,
+                       now: Optional[int] = None) -> int:
+        now = now if now is not None else int(time.time())
+        return sum(info.estimate_bytes(start_time, end_time, now) for info in self.log_group_info(group_names))
+
+    def narrow_start_time(self, group_names: List[str], start_time: int, end_time: int, max_bytes: int,
+                          now: Optional[int] = None) -> int:
+        """The earliest start time, no earlier than `start_time`, for which the estimate is within `max_bytes`"""
+        now = now if now is not None else int(time.time())
+        low, high = start_time, end_time
+        while low < high:
+            middle = (low + high) // 2
+            if self.estimate_bytes(group_names, middle, end_time, now=now) <= max_bytes:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+
+def parse_bytes(bytes_raw: Any) -> int:
+    """Parses a number of bytes, optionally with a binary unit suffix: 500, '20MB', '1.5 GiB', '2T'"""
+    if not isinstance(bytes_raw, str):
+        return int(bytes_raw)
+    bytes_str = bytes_raw.strip().upper()
+    for suffix in ('IB', 'B'):
+        if bytes_str.endswith(suffix):
+            bytes_str = bytes_str[:-len(suffix)]
+            break
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4, 'P': 1024 ** 5}
+    multiplier = 1
+    if bytes_str and bytes_str[-1] in multipliers:
+        multiplier = multipliers[bytes_str[-1]]
+        bytes_str = bytes_str[:-1]
+    return int(float(bytes_str.strip()) * multiplier)
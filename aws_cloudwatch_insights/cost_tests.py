@@ -0,0 +1,125 @@
+from typing import List, Optional
+from unittest.mock import MagicMock
+
+import pytest
+
+from aws_cloudwatch_insights.aws_cloudwatch_insights import Insights, ResponseStatus, GenericDict
+from aws_cloudwatch_insights.cost import ScanEstimator, ScanBudgetExceededException, LogGroupInfo, parse_bytes
+
+DAY = 24 * 60 * 60
+NOW = 1000 * DAY
+
+
+def _mock_logs_client(groups: List[GenericDict]) -> MagicMock:
+    mock_logs_client = MagicMock()
+    mock_paginator = MagicMock()
+    mock_paginator.paginate.side_effect = lambda logGroupNamePrefix: [
+        {'logGroups': [g for g in groups if g['logGroupName'].startswith(logGroupNamePrefix)]}
+    ]
+    mock_logs_client.get_paginator.return_value = mock_paginator
+    return mock_logs_client
+
+
+GROUPS = [
+    # 100 days of data, 1000 bytes a day
+    {'logGroupName': '/aws/lambda/a', 'storedBytes': 100_000, 'creationTime': (NOW - 100 * DAY) * 1000},
+    # 10 days of retention, 100 bytes a day
+    {'logGroupName': '/aws/lambda/a-2', 'storedBytes': 1000, 'creationTime': 0, 'retentionInDays': 10},
+]
+
+
+def test_log_group_info_estimate_bytes():
+    info = LogGroupInfo(name='/aws/lambda/a', stored_bytes=100_000, creation_time=NOW - 100 * DAY)
+    assert info.estimate_bytes(NOW - 10 * DAY, NOW, now=NOW) == 10_000
+    assert info.estimate_bytes(NOW - 200 * DAY, NOW, now=NOW) == 100_000
+    assert info.estimate_bytes(0, NOW - 200 * DAY, now=NOW) == 0
+
+
+def test_scan_estimator():
+    mock_logs_client = _mock_logs_client(GROUPS)
+    estimator = ScanEstimator(mock_logs_client)
+    group_names = ['/aws/lambda/a', '/aws/lambda/a-2', '/aws/lambda/missing']
+
+    assert estimator.estimate_bytes(group_names, NOW - 5 * DAY, NOW, now=NOW) == 5000 + 500
+    assert estimator.estimate_bytes(group_names, NOW - 50 * DAY, NOW, now=NOW) == 50_000 + 1000
+    # describe_log_groups is only called once per group
+    assert mock_logs_client.get_paginator.return_value.paginate.call_count == 3
+
+    narrowed = estimator.narrow_start_time(group_names, NOW - 50 * DAY, NOW, max_bytes=11_000, now=NOW)
+    assert estimator.estimate_bytes(group_names, narrowed, NOW, now=NOW) <= 11_000
+    assert estimator.estimate_bytes(group_names, narrowed - 1, NOW, now=NOW) > 11_000
+
+
+@pytest.mark.parametrize('bytes_raw,expected', [
+    (500, 500), ('500', 500), ('2KB', 2048), ('1.5 GiB', int(1.5 * 1024 ** 3)), ('3m', 3 * 1024 ** 2), ('1T', 1024 ** 4)
+])
+def test_parse_bytes(bytes_raw, expected):
+    assert parse_bytes(bytes_raw) == expected
+
+
+def _insights(get_results_side_effects: Optional[List[GenericDict]] = None) -> Insights:
+    mock_logs_client = _mock_logs_client(GROUPS)
+    mock_logs_client.start_query.return_value = {'queryId': 'fake-query-id'}
+    if get_results_side_effects is not None:
+        mock_logs_client.get_query_results.side_effect = get_results_side_effects
+    return Insights(mock_logs_client)
+
+
+def test_get_insights_refused(monkeypatch):
+    monkeypatch.setattr('aws_cloudwatch_insights.cost.time.time', lambda: NOW)
+    insights = _insights()
+    with pytest.raises(ScanBudgetExceededException) as exc_info:
+        insights.get_insights(
+            'fields @message', result_limit=10, group_names=['/aws/lambda/a'], start_time=NOW - 50 * DAY,
+            end_time=NOW, max_bytes=10_000
+        )
+    assert exc_info.value.estimated
+    assert exc_info.value.scan_bytes == 50_000
+    assert insights.logs_client.start_query.call_count == 0
+
+
+def test_get_insights_narrowed(monkeypatch):
+    monkeypatch.setattr('aws_cloudwatch_insights.cost.time.time', lambda: NOW)
+    insights = _insights([{'status': ResponseStatus.COMPLETE, 'results': []}])
+    insights.get_insights(
+        'fields @message', result_limit=10, group_names=['/aws/lambda/a'], start_time=NOW - 50 * DAY, end_time=NOW,
+        max_bytes=10_000, narrow=True
+    )
+    [(_, start_query_kwargs)] = insights.logs_client.start_query.call_args_list
+    # estimates are truncated to whole bytes, so the narrowed start can be a few seconds earlier than 10 days ago
+    assert NOW - 10 * DAY - 100 < start_query_kwargs['startTime'] <= NOW - 10 * DAY
+
+
+def test_get_insights_stopped_when_over_budget(monkeypatch):
+    monkeypatch.setattr('aws_cloudwatch_insights.cost.time.time', lambda: NOW)
+    insights = _insights([
+        {'status': ResponseStatus.RUNNING, 'results': [], 'statistics': {'bytesScanned': 5000.0}},
+        {'status': ResponseStatus.RUNNING, 'results': [], 'statistics': {'bytesScanned': 20_000.0}},
+        {'status': ResponseStatus.COMPLETE, 'results': [], 'statistics': {'bytesScanned': 30_000.0}},
+    ])
+    mock_error_handler = MagicMock(return_value=None)
+    results = insights.get_insights(
+        'fields @message', result_limit=10, group_names=['/aws/lambda/a'], start_time=NOW - 5 * DAY, end_time=NOW,
+        max_bytes=10_000, error=mock_error_handler
+    )
+    assert list(results) == []
+    [((error, _), _)] = mock_error_handler.call_args_list
+    assert isinstance(error, ScanBudgetExceededException)
+    assert not error.estimated
+    assert error.scan_bytes == 20_000
+    assert insights.logs_client.get_query_results.call_count == 2
+    assert insights.logs_client.stop_query.call_count == 1
+
+
+def test_get_insights_complete_over_budget(monkeypatch):
+    monkeypatch.setattr('aws_cloudwatch_insights.cost.time.time', lambda: NOW)
+    insights = _insights([
+        {'status': ResponseStatus.COMPLETE, 'results': [[{'field': 'foo', 'value': 'bar'}]],
+         'statistics': {'bytesScanned': 20_000.0}},
+    ])
+    results = insights.get_insights(
+        'fields foo', result_limit=10, group_names=['/aws/lambda/a'], start_time=NOW - 5 * DAY, end_time=NOW,
+        max_bytes=10_000
+    )
+    assert list(results) == [{'foo': 'bar'}], 'A query that has already completed keeps its results'
+    assert insights.logs_client.stop_query.call_count == 0
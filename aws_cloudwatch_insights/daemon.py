@@ -0,0 +1,232 @@
+"""A long-lived process that keeps Insights instances warm and serves queries over a local unix socket."""
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import stat
+import tempfile
+import threading
+from typing import Optional, Dict, Callable, List, Any, TYPE_CHECKING
+
+from .partial import PartialResults
+
+if TYPE_CHECKING:
+    from .aws_cloudwatch_insights import Insights, CloudWatchLogsClient
+
+# not imported from aws_cloudwatch_insights.py, which pulls in boto3 and numpy, and connect() and query_daemon() run
+# in the cli, which needs neither to talk to the daemon
+GenericDict = Dict[str, Any]
+
+
+# the environment variables that decide which account, credentials and region boto3 uses
+AWS_ENVIRONMENT_VARIABLES = [
+    'AWS_PROFILE', 'AWS_DEFAULT_PROFILE', 'AWS_REGION', 'AWS_DEFAULT_REGION', 'AWS_ACCESS_KEY_ID',
+    'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN', 'AWS_CONFIG_FILE', 'AWS_SHARED_CREDENTIALS_FILE', 'AWS_ROLE_ARN',
+    'AWS_WEB_IDENTITY_TOKEN_FILE',
+]
+
+
+def default_socket_path() -> str:
+    """
+    The socket in $XDG_RUNTIME_DIR, which is only accessible to its user, or else in a private dir of our own in the
+    shared temp dir.  Named by uid rather than user name, which not every uid has
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'acwi.sock')
+    # there are no uids on windows, but no unix sockets to serve either
+    uid = os.getuid() if hasattr(os, 'getuid') else 'user'
+    return os.path.join(tempfile.gettempdir(), f"acwi-{uid}", 'acwi.sock')
+
+
+def aws_environment_id() -> str:
+    """
+    Identifies the AWS environment variables of this process, hashed so credentials never leave it.  A daemon only
+    runs queries for callers with the same environment, since its clients were set up from its own
+    """
+    environment = {name: os.environ.get(name) for name in AWS_ENVIRONMENT_VARIABLES}
+    return hashlib.sha256(json.dumps(environment, sort_keys=True).encode()).hexdigest()
+
+
+LogsClientFactory = Callable[[Optional[str]], 'CloudWatchLogsClient']
+
+
+class DaemonException(Exception):
+    """An error raised inside the daemon while running a query"""
+
+
+class DaemonEnvironmentException(DaemonException):
+    """The daemon was started with other AWS credentials, profile or region than the caller has"""
+
+
+class DaemonSocketException(Exception):
+    """The daemon's socket can't be served safely, eg its directory can be written by other users"""
+
+
+def _is_ours(path: str) -> bool:
+    return os.stat(path).st_uid == os.getuid()
+
+
+def _default_logs_client_factory(region: Optional[str]) -> 'CloudWatchLogsClient':
+    from .clients import get_logs_client
+    return get_logs_client(region)
+
+
+class _InsightsRequestHandler(socketserver.StreamRequestHandler):
+    """
+    The protocol is one json line with the arguments to get_insights() plus `region` and `aws_environment` (see
+    aws_environment_id()), answered by a json line per result of the form `{"row": ...}`, then a final
+    `{"done": <row count>}` or `{"error": <message>}`.  If the query was stopped early, the final line is
+    `{"done": <row count>, "partial": true, "reason": <PartialReason>}`.  If the caller's AWS environment isn't the
+    daemon's, the only line is `{"environment_mismatch": true}`
+    """
+    server: 'InsightsDaemon'
+
+    def _send(self, message: GenericDict) -> None:
+        self.wfile.write((json.dumps(message, default=str) + "\n").encode())
+
+    def handle(self) -> None:
+        try:
+            line = self.rfile.readline()
+            if not line:
+                # connected and closed without a request, eg another daemon checking whether this one is running
+                return
+            request = json.loads(line)
+            region = request.pop('region', None)
+            if request.pop('aws_environment', None) != self.server.aws_environment:
+                self._send({'environment_mismatch': True})
+                return
+            results = self.server.insights_for(region).get_insights(**request)
+            rows = 0
+            for row in results:
+                self._send({'row': row})
+                rows += 1
+            if isinstance(results, PartialResults):
+                self._send({'done': rows, 'partial': True, 'reason': results.reason})
+            else:
+                self._send({'done': rows})
+        except BrokenPipeError:
+            # the client went away, nothing to tell it
+            pass
+        except Exception as e:
+            self._send({'error': f"{type(e).__name__}: {e}"})
+
+
+class InsightsDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Optional[str] = None,
+                 logs_client_factory: LogsClientFactory = _default_logs_client_factory):
+        """
+        Serves get_insights() requests on `socket_path`, keeping one Insights instance (and its boto3 client) per region
+        for the life of the process.  Only callers with the same AWS environment variables are served.  Default
+        `socket_path`: default_socket_path()
+        """
+        socket_path = socket_path or default_socket_path()
+        self.socket_path = socket_path
+        self.aws_environment = aws_environment_id()
+        self._logs_client_factory = logs_client_factory
+        self._insights: Dict[Optional[str], 'Insights'] = {}
+        self._insights_lock = threading.Lock()
+        socket_dir = os.path.dirname(os.path.abspath(socket_path))
+        if not os.path.exists(socket_dir):
+            os.makedirs(socket_dir, mode=0o700)
+        socket_dir_stat = os.stat(socket_dir)
+        # only its owner (and root) can replace files in a dir, unless others can write to it without it being sticky
+        if socket_dir_stat.st_uid not in {os.getuid(), 0} or (
+            socket_dir_stat.st_mode & 0o022 and not socket_dir_stat.st_mode & stat.S_ISVTX
+        ):
+            raise DaemonSocketException(
+                f"{socket_dir!r} has to belong to this user and not be writable by others, since they could replace"
+                f" the socket"
+            )
+        if os.path.exists(socket_path):
+            running = connect(socket_path)
+            if running is not None:
+                running.close()
+                raise DaemonSocketException(f"A daemon is already running on {socket_path!r}")
+            # left over from a daemon that didn't shut down cleanly
+            os.unlink(socket_path)
+        super().__init__(socket_path, _InsightsRequestHandler)
+        os.chmod(socket_path, 0o600)
+        socket_stat = os.stat(socket_path)
+        self._socket_inode = (socket_stat.st_dev, socket_stat.st_ino)
+
+    def insights_for(self, region: Optional[str]) -> 'Insights':
+        from .aws_cloudwatch_insights import Insights
+        with self._insights_lock:
+            if region not in self._insights:
+                self._insights[region] = Insights(self._logs_client_factory(region))
+            return self._insights[region]
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            socket_stat = os.stat(self.socket_path)
+        except FileNotFoundError:
+            return
+        # only if it's still the socket this daemon bound, rather than one a later daemon replaced it with
+        if (socket_stat.st_dev, socket_stat.st_ino) == self._socket_inode:
+            os.unlink(self.socket_path)
+
+
+def serve(socket_path: Optional[str] = None) -> None:
+    """Runs the daemon until interrupted"""
+    daemon = InsightsDaemon(socket_path)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.server_close()
+
+
+def connect(socket_path: Optional[str] = None) -> Optional[socket.socket]:
+    """Returns a connection to a running daemon, or None if there isn't one, or the socket isn't this user's"""
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    socket_path = socket_path or default_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+    if not _is_ours(socket_path):
+        # some other user's socket, which could be anything listening in on our queries
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def query_daemon(sock: socket.socket, region: Optional[str], **get_insights_kwargs: Any) -> List[GenericDict]:
+    """
+    Sends get_insights() arguments to the daemon over a connection from connect(), and returns the rows it streams
+    back, as a PartialResults list if the query was stopped early, like get_insights() does.  Raises
+    DaemonEnvironmentException if the daemon was started with a different AWS environment, in which case the query
+    should be run in-process.  Closes the connection when done
+    """
+    try:
+        request = {**get_insights_kwargs, 'region': region, 'aws_environment': aws_environment_id()}
+        sock.sendall((json.dumps(request) + "\n").encode())
+        rows: List[GenericDict] = []
+        with sock.makefile('rb') as fin:
+            for line in fin:
+                message = json.loads(line)
+                if 'row' in message:
+                    rows.append(message['row'])
+                elif message.get('environment_mismatch'):
+                    raise DaemonEnvironmentException(
+                        "The daemon was started with other AWS credentials, profile or region"
+                    )
+                elif 'error' in message:
+                    raise DaemonException(message['error'])
+                elif message.get('partial'):
+                    return PartialResults(rows, reason=message['reason'])
+                else:
+                    return rows
+        raise DaemonException('Connection to daemon closed before the query finished')
+    finally:
+        sock.close()
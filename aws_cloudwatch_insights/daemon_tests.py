@@ -0,0 +1,148 @@
+import os
+import tempfile
+import threading
+from typing import Optional, List
+from unittest.mock import MagicMock
+
+import pytest
+
+from aws_cloudwatch_insights.aws_cloudwatch_insights import ResponseStatus
+from aws_cloudwatch_insights.partial import PartialResults, PartialReason
+from aws_cloudwatch_insights.daemon import InsightsDaemon, connect, query_daemon, DaemonException, \
+    DaemonSocketException, DaemonEnvironmentException, default_socket_path
+
+
+@pytest.fixture
+def socket_path(tmp_path) -> str:
+    return str(tmp_path / 'acwi.sock')
+
+
+@pytest.fixture
+def logs_client() -> MagicMock:
+    mock_logs_client = MagicMock()
+    mock_logs_client.start_query.return_value = {'queryId': 'fake-query-id'}
+    mock_logs_client.get_query_results.return_value = {
+        'status': ResponseStatus.COMPLETE,
+        'results': [
+            [{'field': 'foo', 'value': '{"bar": 1}'}],
+            [{'field': 'foo', 'value': 'scalar'}],
+        ]
+    }
+    return mock_logs_client
+
+
+@pytest.fixture
+def regions_requested() -> List[Optional[str]]:
+    return []
+
+
+@pytest.fixture
+def running_daemon(socket_path, logs_client, regions_requested):
+    def _logs_client_factory(region: Optional[str]) -> MagicMock:
+        regions_requested.append(region)
+        return logs_client
+
+    daemon = InsightsDaemon(socket_path, logs_client_factory=_logs_client_factory)
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    yield daemon
+    daemon.shutdown()
+    daemon.server_close()
+    thread.join()
+
+
+def _query(socket_path: str, region: Optional[str] = 'us-west-2', **kwargs) -> List:
+    sock = connect(socket_path)
+    assert sock is not None
+    return query_daemon(
+        sock, region=region, query='fields @message', group_names=['/aws/lambda/a'], start_time=0, end_time=100,
+        **{'result_limit': 10, **kwargs}
+    )
+
+
+def test_connect_no_daemon(socket_path):
+    assert connect(socket_path) is None
+
+
+def test_query_daemon(running_daemon, socket_path, logs_client, regions_requested):
+    assert _query(socket_path) == [{'foo': {'bar': 1}}, {'foo': 'scalar'}]
+    assert _query(socket_path, jsonify=False) == [{'foo': '{"bar": 1}'}, {'foo': 'scalar'}]
+    _query(socket_path, region='us-east-1')
+
+    # the client is only created once per region
+    assert regions_requested == ['us-west-2', 'us-east-1']
+    assert logs_client.start_query.call_count == 3
+
+
+def test_query_daemon_partial(running_daemon, socket_path, logs_client):
+    logs_client.get_query_results.return_value['status'] = ResponseStatus.RUNNING
+    results = _query(socket_path, result_limit=2, stop_at_limit=True)
+    assert isinstance(results, PartialResults)
+    assert results.reason == PartialReason.LIMIT
+    assert results == [{'foo': {'bar': 1}}, {'foo': 'scalar'}]
+
+    logs_client.get_query_results.return_value['status'] = ResponseStatus.COMPLETE
+    assert not isinstance(_query(socket_path, result_limit=2, stop_at_limit=True), PartialResults)
+
+
+def test_query_daemon_error(running_daemon, socket_path, logs_client):
+    logs_client.get_query_results.return_value = {'status': 'Failed'}
+    with pytest.raises(DaemonException, match='InsightsRemoteException'):
+        _query(socket_path)
+
+
+def test_daemon_cleans_up_socket(socket_path, logs_client):
+    daemon = InsightsDaemon(socket_path, logs_client_factory=lambda _: logs_client)
+    daemon.server_close()
+    assert connect(socket_path) is None
+
+
+def test_connect_other_users_socket(running_daemon, socket_path, monkeypatch):
+    monkeypatch.setattr(os, 'getuid', lambda: os.stat(socket_path).st_uid + 1)
+    assert connect(socket_path) is None, "Another user's socket could be anyone listening in"
+
+
+def test_daemon_socket_dir(tmp_path, logs_client):
+    socket_dir = tmp_path / 'private'
+    daemon = InsightsDaemon(str(socket_dir / 'acwi.sock'), logs_client_factory=lambda _: logs_client)
+    daemon.server_close()
+    assert socket_dir.stat().st_mode & 0o777 == 0o700
+
+    shared_dir = tmp_path / 'shared'
+    shared_dir.mkdir()
+    shared_dir.chmod(0o777)
+    with pytest.raises(DaemonSocketException):
+        InsightsDaemon(str(shared_dir / 'acwi.sock'), logs_client_factory=lambda _: logs_client)
+
+
+def test_query_daemon_other_aws_environment(running_daemon, socket_path, logs_client, monkeypatch):
+    monkeypatch.setenv('AWS_PROFILE', 'some-other-profile')
+    with pytest.raises(DaemonEnvironmentException):
+        _query(socket_path)
+    assert logs_client.start_query.call_count == 0, "Queries aren't run with the daemon's credentials"
+
+
+def test_daemon_already_running(running_daemon, socket_path, logs_client):
+    with pytest.raises(DaemonSocketException):
+        InsightsDaemon(socket_path, logs_client_factory=lambda _: logs_client)
+    assert connect(socket_path) is not None, "The running daemon's socket is left alone"
+
+
+def test_daemon_leaves_replaced_socket(socket_path, logs_client):
+    old_daemon = InsightsDaemon(socket_path, logs_client_factory=lambda _: logs_client)
+    os.unlink(socket_path)
+    new_daemon = InsightsDaemon(socket_path, logs_client_factory=lambda _: logs_client)
+    old_daemon.server_close()
+    assert os.path.exists(socket_path), 'Only the socket the daemon bound is removed'
+    new_daemon.server_close()
+    assert not os.path.exists(socket_path)
+
+
+def test_default_socket_path(monkeypatch, tmp_path):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    assert default_socket_path() == str(tmp_path / 'acwi.sock')
+
+    # eg in a container running as a uid with no user name
+    monkeypatch.delenv('XDG_RUNTIME_DIR')
+    monkeypatch.setattr(os, 'getuid', lambda: 12345)
+    assert default_socket_path() == os.path.join(tempfile.gettempdir(), 'acwi-12345', 'acwi.sock')
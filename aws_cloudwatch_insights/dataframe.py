@@ -0,0 +1,123 @@
+"""Building DataFrames straight from raw Insights results, without making a dict per row."""
+import json
+from json import JSONDecodeError
+from typing import Dict, List, Any, Iterable, Union, Optional
+
+from .typed import Schema, FieldType, infer_field_type, convert_column
+
+Columns = Dict[str, List[Any]]
+
+
+class DataFrameLibrary:
+    PANDAS = 'pandas'
+    POLARS = 'polars'
+
+
+def columnize_results(results_raw: Iterable[Iterable[Dict[str, Any]]]) -> Columns:
+    """
+    Turns the `[[{'field': ..., 'value': ...}, ...], ...]` lists Insights returns into a dict of column name to list of
+    values, with None where a row is missing a field
+    """
+    columns: Columns = {}
+    row_count = 0
+    for row in results_raw:
+        for result_field in row:
+            column = columns.get(result_field['field'])
+            if column is None:
+                column = columns[result_field['field']] = [None] * row_count
+            column.append(result_field['value'])
+        row_count += 1
+        for column in columns.values():
+            if len(column) < row_count:
+                column.append(None)
+    return columns
+
+
+def _flatten(value: Any, prefix: str, into: Dict[str, Any]) -> None:
+    if isinstance(value, dict) and value:
+        for key, sub_value in value.items():
+            _flatten(sub_value, f"{prefix}.{key}", into)
+    else:
+        into[prefix] = value
+
+
+def expand_json_columns(columns: Columns) -> Columns:
+    """
+    Replaces each column holding json objects with one column per (dotted) key path: a `body` column holding
+    `{"a": {"b": 1}}` becomes `body.a.b`.  Values that aren't json objects stay in the original column
+    """
+    expanded: Columns = {}
+    for name, values in columns.items():
+        if not any(isinstance(v, str) and v.startswith('{') for v in values):
+            expanded[name] = values
+            continue
+
+        row_count = len(values)
+        unparsed: List[Any] = [None] * row_count
+        sub_columns: Columns = {}
+        for i, value in enumerate(values):
+            parsed = None
+            if isinstance(value, str) and value.startswith('{'):
+                try:
+                    parsed = json.loads(value)
+                except JSONDecodeError:
+                    pass
+            if not isinstance(parsed, dict):
+                unparsed[i] = value
+                continue
+            flattened: Dict[str, Any] = {}
+            _flatten(parsed, name, flattened)
+            for sub_name, sub_value in flattened.items():
+                sub_column = sub_columns.get(sub_name)
+                if sub_column is None:
+                    sub_column = sub_columns[sub_name] = [None] * row_count
+                sub_column[i] = sub_value
+
+        if any(v is not None for v in unparsed):
+            expanded[name] = unparsed
+        expanded.update(sub_columns)
+    return expanded
+
+
+def type_columns(columns: Columns, schema: Optional[Schema] = None) -> Columns:
+    """Converts each column to its type in `schema`, or to its inferred type if `schema` is None"""
+    for name, values in columns.items():
+        if schema is None:
+            field_type = infer_field_type(name, values)
+        elif name in schema:
+            field_type = schema[name]
+        else:
+            continue
+        if field_type == FieldType.STRING:
+            continue
+        indexes = [i for i, v in enumerate(values) if v is not None]
+        converted = convert_column([values[i] for i in indexes], field_type)
+        for i, value in zip(indexes, converted):
+            values[i] = value
+    return columns
+
+
+def build_dataframe(results_raw: Iterable[Iterable[Dict[str, Any]]], library: str = DataFrameLibrary.PANDAS,
+                    typed: Union[bool, Schema] = False, expand_json: bool = False) -> Any:
+    columns = columnize_results(results_raw)
+    if expand_json:
+        columns = expand_json_columns(columns)
+    if typed:
+        columns = type_columns(columns, schema=typed if isinstance(typed, dict) else None)
+
+    if library == DataFrameLibrary.PANDAS:
+        try:
+            import pandas as pd  # type: ignore
+        except ModuleNotFoundError as e:
+            raise ModuleNotFoundError(f"{e.msg}, you may need to install it: `pip install"
+                                      f" aws_cloudwatch_insights[pandas]`")
+        return pd.DataFrame(columns)
+    elif library == DataFrameLibrary.POLARS:
+        try:
+            import polars as pl
+        except ModuleNotFoundError as e:
+            raise ModuleNotFoundError(f"{e.msg}, you may need to install it: `pip install"
+                                      f" aws_cloudwatch_insights[polars]`")
+        return pl.DataFrame(columns, strict=False)
+    else:
+        raise ValueError(f"Unknown DataFrame library: {library!r}")
@@ -0,0 +1,95 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from aws_cloudwatch_insights.aws_cloudwatch_insights import Insights, ResponseStatus
+from aws_cloudwatch_insights.dataframe import columnize_results, expand_json_columns, type_columns
+
+RESULTS_RAW = [
+    [
+        {'field': '@timestamp', 'value': '2023-02-20 14:56:40.123'},
+        {'field': '@message', 'value': '{"level": "INFO", "request": {"id": "a"}}'},
+        {'field': 'count', 'value': '3'},
+    ],
+    [
+        {'field': '@timestamp', 'value': '2023-02-20 14:56:41.000'},
+        {'field': '@message', 'value': 'plain text'},
+    ],
+    [
+        {'field': '@timestamp', 'value': '2023-02-20 14:56:42.000'},
+        {'field': '@message', 'value': '{"level": "ERROR"}'},
+        {'field': 'count', 'value': '5'},
+    ],
+]
+
+
+def test_columnize_results():
+    assert columnize_results(RESULTS_RAW) == {
+        '@timestamp': ['2023-02-20 14:56:40.123', '2023-02-20 14:56:41.000', '2023-02-20 14:56:42.000'],
+        '@message': ['{"level": "INFO", "request": {"id": "a"}}', 'plain text', '{"level": "ERROR"}'],
+        'count': ['3', None, '5'],
+    }
+
+
+def test_columnize_results_late_field():
+    assert columnize_results([[{'field': 'a', 'value': '1'}], [{'field': 'b', 'value': '2'}]]) == {
+        'a': ['1', None],
+        'b': [None, '2'],
+    }
+
+
+def test_expand_json_columns():
+    assert expand_json_columns(columnize_results(RESULTS_RAW)) == {
+        '@timestamp': ['2023-02-20 14:56:40.123', '2023-02-20 14:56:41.000', '2023-02-20 14:56:42.000'],
+        '@message': [None, 'plain text', None],
+        '@message.level': ['INFO', None, 'ERROR'],
+        '@message.request.id': ['a', None, None],
+        'count': ['3', None, '5'],
+    }
+
+
+def test_type_columns():
+    columns = type_columns(columnize_results(RESULTS_RAW))
+    assert columns['@timestamp'] == [1676905000123, 1676905001000, 1676905002000]
+    assert columns['count'] == [3, None, 5]
+    assert columns['@message'][1] == 'plain text'
+
+
+def _mock_logs_client() -> MagicMock:
+    mock_logs_client = MagicMock()
+    mock_logs_client.start_query.return_value = {'queryId': 'fake-query-id'}
+    mock_logs_client.get_query_results.return_value = {'status': ResponseStatus.COMPLETE, 'results': RESULTS_RAW}
+    return mock_logs_client
+
+
+def test_get_insights_df_pandas():
+    pd = pytest.importorskip('pandas')
+    df = Insights(_mock_logs_client()).get_insights_df(
+        query='fields @timestamp, @message', result_limit=10, group_names=['/aws/lambda/a'], start_time=0,
+        end_time=100, typed={'@timestamp': 'datetime', 'count': 'int'}, expand_json=True
+    )
+    assert list(df.columns) == ['@timestamp', '@message', '@message.level', '@message.request.id', 'count']
+    assert len(df) == 3
+    assert df['@timestamp'][0] == pd.Timestamp('2023-02-20 14:56:40.123', tz='UTC')
+    assert df['@message.level'].isna().tolist() == [False, True, False]
+    assert df['@message.level'][2] == 'ERROR'
+
+
+def test_get_insights_df_polars():
+    pytest.importorskip('polars')
+    df = Insights(_mock_logs_client()).get_insights_df(
+        query='fields @timestamp, @message', result_limit=10, group_names=['/aws/lambda/a'], start_time=0,
+        end_time=100, library='polars', typed=True
+    )
+    assert df.columns == ['@timestamp', '@message', 'count']
+    assert df['count'].to_list() == [3, None, 5]
+
+
+def test_get_insights_df_unknown_library():
+    mock_logs_client = _mock_logs_client()
+    with pytest.raises(ValueError):
+        Insights(mock_logs_client).get_insights_df(
+            query='fields @timestamp', result_limit=10, group_names=['/aws/lambda/a'], start_time=0, end_time=100,
+            library='excel'
+        )
+    assert mock_logs_client.start_query.call_count == 0
@@ -0,0 +1,106 @@
+"""Observing the lifecycle of Insights queries: events, timings and tracing spans."""
+import time
+from typing import List, Optional, Dict, Any, Mapping
+
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'LimitExceededException', 'TooManyRequestsException'}
+
+
+class PostProcessStage:
+    DICTIFY = 'dictify'
+    JSONIFY = 'jsonify'
+    TYPED = 'typed'
+
+
+class InsightsHooks:
+    """
+    Base class for observing queries run by an Insights instance.  Every method does nothing, so subclasses only need
+    to override the events they care about.  Pass an instance to Insights(hooks=...)
+    """
+
+    def on_query_started(self, query_id: str, query: str, group_names: List[str]) -> None:
+        pass
+
+    def on_poll(self, query_id: str, status: str, row_count: int, statistics: Mapping[str, Any]) -> None:
+        pass
+
+    def on_throttled(self, query_id: Optional[str], operation: str, error: Exception) -> None:
+        """Called when AWS throttles a call.  `query_id` is None if the throttled call was start_query"""
+        pass
+
+    def on_completed(self, query_id: str, row_count: int, statistics: Mapping[str, Any]) -> None:
+        pass
+
+    def on_cancelled(self, query_id: str, reason: str) -> None:
+        """
+        Called when a query is stopped before completing, or fails after completing, eg while post-processing.  Every
+        started query gets either this or on_completed().  `reason` is a PartialReason or an exception class name
+        """
+        pass
+
+    def on_post_processed(self, query_id: str, stage: str, seconds: float, row_count: int) -> None:
+        """Called after each post-processing stage (see PostProcessStage), with how long it took"""
+        pass
+
+
+class OpenTelemetryHooks(InsightsHooks):
+    def __init__(self, tracer: Any = None):
+        """
+        Emits an OpenTelemetry span per query, with an event per poll and a child span per post-processing stage.
+        Uses the global tracer provider unless a tracer is passed.  Requires the `opentelemetry-api` package
+        """
+        if tracer is None:
+            try:
+                from opentelemetry import trace
+            except ModuleNotFoundError as e:
+                raise ModuleNotFoundError(f"{e.msg}, you may need to install it: `pip install opentelemetry-api`")
+            tracer = trace.get_tracer(__name__)
+        self.tracer = tracer
+        self._spans: Dict[str, Any] = {}
+
+    def on_query_started(self, query_id: str, query: str, group_names: List[str]) -> None:
+        self._spans[query_id] = self.tracer.start_span('insights.query', attributes={
+            'insights.query_id': query_id,
+            'insights.query': query,
+            'insights.group_names': group_names,
+        })
+
+    def on_poll(self, query_id: str, status: str, row_count: int, statistics: Mapping[str, Any]) -> None:
+        span = self._spans.get(query_id)
+        if span is not None:
+            span.add_event('insights.poll', attributes={
+                'insights.status': status,
+                'insights.row_count': row_count,
+                **{f"insights.statistics.{k}": v for k, v in statistics.items()}
+            })
+
+    def on_throttled(self, query_id: Optional[str], operation: str, error: Exception) -> None:
+        span = self._spans.get(query_id) if query_id is not None else None
+        if span is not None:
+            span.add_event('insights.throttled', attributes={'insights.operation': operation})
+
+    def on_post_processed(self, query_id: str, stage: str, seconds: float, row_count: int) -> None:
+        from opentelemetry import trace
+
+        parent = self._spans.get(query_id)
+        if parent is None:
+            return
+        end_ns = time.time_ns()
+        span = self.tracer.start_span(
+            f"insights.{stage}", context=trace.set_span_in_context(parent), start_time=end_ns - int(seconds * 1e9),
+            attributes={'insights.row_count': row_count}
+        )
+        span.end(end_time=end_ns)
+
+    def on_completed(self, query_id: str, row_count: int, statistics: Mapping[str, Any]) -> None:
+        span = self._spans.pop(query_id, None)
+        if span is not None:
+            span.set_attribute('insights.row_count', row_count)
+            for key, value in statistics.items():
+                span.set_attribute(f"insights.statistics.{key}", value)
+            span.end()
+
+    def on_cancelled(self, query_id: str, reason: str) -> None:
+        span = self._spans.pop(query_id, None)
+        if span is not None:
+            span.set_attribute('insights.cancelled', reason)
+            span.end()
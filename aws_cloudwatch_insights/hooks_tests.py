@@ -0,0 +1,129 @@
+from typing import List, Tuple, Any
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from aws_cloudwatch_insights import aws_cloudwatch_insights
+from aws_cloudwatch_insights.aws_cloudwatch_insights import Insights, ResponseStatus
+from aws_cloudwatch_insights.hooks import InsightsHooks, OpenTelemetryHooks
+
+
+class RecordingHooks(InsightsHooks):
+    def __init__(self):
+        self.events: List[Tuple[Any, ...]] = []
+
+    def on_query_started(self, query_id, query, group_names):
+        self.events.append(('started', query_id))
+
+    def on_poll(self, query_id, status, row_count, statistics):
+        self.events.append(('poll', query_id, status, row_count, dict(statistics)))
+
+    def on_throttled(self, query_id, operation, error):
+        self.events.append(('throttled', query_id, operation))
+
+    def on_completed(self, query_id, row_count, statistics):
+        self.events.append(('completed', query_id, row_count))
+
+    def on_cancelled(self, query_id, reason):
+        self.events.append(('cancelled', query_id, reason))
+
+    def on_post_processed(self, query_id, stage, seconds, row_count):
+        assert seconds >= 0
+        self.events.append(('post_processed', query_id, stage, row_count))
+
+
+def _mock_logs_client() -> MagicMock:
+    mock_logs_client = MagicMock()
+    mock_logs_client.start_query.return_value = {'queryId': 'fake-query-id'}
+    mock_logs_client.get_query_results.side_effect = [
+        {'status': ResponseStatus.SCHEDULED, 'statistics': {'bytesScanned': 0.0}},
+        {
+            'status': ResponseStatus.COMPLETE,
+            'results': [[{'field': 'foo', 'value': '{"a": 1}'}], [{'field': 'foo', 'value': '2'}]],
+            'statistics': {'bytesScanned': 100.0}
+        },
+    ]
+    return mock_logs_client
+
+
+def _get_insights(insights: Insights, **kwargs) -> list:
+    return list(insights.get_insights(
+        'fields foo', result_limit=10, group_names=['/aws/lambda/a'], start_time=0, end_time=100, **kwargs
+    ))
+
+
+def test_hooks():
+    hooks = RecordingHooks()
+    results = _get_insights(Insights(_mock_logs_client(), hooks=hooks), typed=True)
+    assert results == [{'foo': {'a': 1}}, {'foo': '2'}]
+    assert hooks.events == [
+        ('started', 'fake-query-id'),
+        ('poll', 'fake-query-id', ResponseStatus.SCHEDULED, 0, {'bytesScanned': 0.0}),
+        ('poll', 'fake-query-id', ResponseStatus.COMPLETE, 2, {'bytesScanned': 100.0}),
+        ('post_processed', 'fake-query-id', 'dictify', 2),
+        ('post_processed', 'fake-query-id', 'jsonify', 2),
+        ('post_processed', 'fake-query-id', 'typed', 2),
+        ('completed', 'fake-query-id', 2),
+    ]
+
+
+def test_hooks_throttled_and_cancelled():
+    mock_logs_client = _mock_logs_client()
+    mock_logs_client.get_query_results.side_effect = ClientError(
+        {'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, 'GetQueryResults'
+    )
+    hooks = RecordingHooks()
+    with pytest.raises(ClientError):
+        _get_insights(Insights(mock_logs_client, hooks=hooks))
+    assert hooks.events == [
+        ('started', 'fake-query-id'),
+        ('throttled', 'fake-query-id', 'GetQueryResults'),
+        ('cancelled', 'fake-query-id', 'ClientError'),
+    ]
+
+
+def test_hooks_post_process_fails(monkeypatch):
+    def _fail(*_, **__):
+        raise ValueError('bad value')
+
+    monkeypatch.setattr(aws_cloudwatch_insights, 'decode_typed_results', _fail)
+    hooks = RecordingHooks()
+    with pytest.raises(ValueError):
+        _get_insights(Insights(_mock_logs_client(), hooks=hooks), typed=True)
+    assert hooks.events[-1] == ('cancelled', 'fake-query-id', 'ValueError'), \
+        'A query that fails after completing still gets a terminal hook'
+    assert 'completed' not in {event[0] for event in hooks.events}
+
+
+def test_hooks_start_query_throttled():
+    mock_logs_client = _mock_logs_client()
+    mock_logs_client.start_query.side_effect = ClientError(
+        {'Error': {'Code': 'LimitExceededException', 'Message': 'Too many concurrent queries'}}, 'StartQuery'
+    )
+    hooks = RecordingHooks()
+    with pytest.raises(ClientError):
+        _get_insights(Insights(mock_logs_client, hooks=hooks))
+    assert hooks.events == [('throttled', None, 'StartQuery')]
+
+
+def test_open_telemetry_hooks():
+    pytest.importorskip('opentelemetry.sdk')
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    hooks = OpenTelemetryHooks(tracer=provider.get_tracer(__name__))
+
+    _get_insights(Insights(_mock_logs_client(), hooks=hooks))
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    assert set(spans) == {'insights.query', 'insights.dictify', 'insights.jsonify'}
+    query_span = spans['insights.query']
+    assert query_span.attributes['insights.query_id'] == 'fake-query-id'
+    assert query_span.attributes['insights.row_count'] == 2
+    assert [e.name for e in query_span.events] == ['insights.poll', 'insights.poll']
+    assert spans['insights.dictify'].parent.span_id == query_span.context.span_id
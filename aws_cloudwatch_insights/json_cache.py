@@ -0,0 +1,57 @@
+"""Memoized json parsing, for results where the same payloads, keys and values come up again and again."""
+import json
+import sys
+from functools import lru_cache
+from json import JSONDecodeError
+from typing import Any, List, Tuple, Dict
+
+_INVALID = object()
+
+
+class JsonCache:
+    def __init__(self, max_size: int = 4096, max_length: int = 8192, intern_max_length: int = 64):
+        """
+        Parses json with a bounded LRU cache keyed on the raw string, so identical payloads are only parsed once, and
+        interns dict keys and short string values, so repeated ones share a single copy in memory.
+
+        Parsed values are shared between every string they were parsed from, so they shouldn't be modified.
+
+        max_size: The most parsed strings kept in the cache
+        max_length: Strings longer than this aren't cached, since they're unlikely to repeat
+        intern_max_length: String values up to this long are interned.  Keys are always interned
+        """
+        self.max_length = max_length
+        self.intern_max_length = intern_max_length
+        self._decoder = json.JSONDecoder(object_pairs_hook=self._make_dict)
+        self._cached_decode = lru_cache(maxsize=max_size)(self._decode)
+
+    def _make_dict(self, pairs: List[Tuple[str, Any]]) -> Dict[str, Any]:
+        intern_max_length = self.intern_max_length
+        return {
+            sys.intern(key): sys.intern(value) if isinstance(value, str) and len(value) <= intern_max_length else value
+            for key, value in pairs
+        }
+
+    def _decode(self, value: str) -> Any:
+        try:
+            return self._decoder.decode(value)
+        except JSONDecodeError:
+            # remember that this one doesn't parse, too
+            return _INVALID
+
+    def loads(self, value: str) -> Any:
+        """Like json.loads(), raising JSONDecodeError if `value` isn't valid json"""
+        if len(value) > self.max_length:
+            parsed = self._decode(value)
+        else:
+            parsed = self._cached_decode(value)
+        if parsed is _INVALID:
+            raise JSONDecodeError('Invalid json', value, 0)
+        return parsed
+
+    def cache_info(self) -> Any:
+        """Hits, misses and size of the cache, as from functools.lru_cache"""
+        return self._cached_decode.cache_info()
+
+    def clear(self) -> None:
+        self._cached_decode.cache_clear()
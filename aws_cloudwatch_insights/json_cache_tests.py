@@ -0,0 +1,73 @@
+import json
+from json import JSONDecodeError
+from unittest.mock import MagicMock
+
+import pytest
+
+from aws_cloudwatch_insights.aws_cloudwatch_insights import Insights, ResponseStatus, jsonify_insights_results
+from aws_cloudwatch_insights.json_cache import JsonCache
+
+
+def test_json_cache_loads():
+    json_cache = JsonCache(max_size=2)
+    first = json_cache.loads('{"level": "INFO", "n": [1, 2]}')
+    assert first == {'level': 'INFO', 'n': [1, 2]}
+    assert json_cache.loads('{"level": "INFO", "n": [1, 2]}') is first
+    assert json_cache.cache_info().hits == 1
+
+    json_cache.loads('{"a": 1}')
+    json_cache.loads('{"b": 2}')
+    # evicted
+    assert json_cache.loads('{"level": "INFO", "n": [1, 2]}') is not first
+
+
+def test_json_cache_interns():
+    json_cache = JsonCache(intern_max_length=10)
+    a = json_cache.loads('{"service_name": "checkout", "msg": "' + 'x' * 20 + '"}')
+    b = json_cache.loads('{"service_name": "checkout", "msg": "' + 'y' * 20 + '"}')
+    [key_a] = [k for k in a if k == 'service_name']
+    [key_b] = [k for k in b if k == 'service_name']
+    assert key_a is key_b
+    assert a['service_name'] is b['service_name']
+    assert a['msg'] is not b['msg']
+
+
+def test_json_cache_invalid():
+    json_cache = JsonCache()
+    for _ in range(2):
+        with pytest.raises(JSONDecodeError):
+            json_cache.loads('{not json')
+    assert json_cache.cache_info().hits == 1
+
+
+def test_json_cache_max_length():
+    json_cache = JsonCache(max_length=10)
+    long_json = json.dumps({'message': 'x' * 20})
+    assert json_cache.loads(long_json) == {'message': 'x' * 20}
+    assert json_cache.loads(long_json) is not json_cache.loads(long_json)
+    assert json_cache.cache_info().currsize == 0
+
+
+def test_jsonify_insights_results_cached():
+    rows = [{'foo': '{"a": 1}', 'bar': '{bad'}, {'foo': '{"a": 1}', 'bar': 'scalar'}]
+    expected = list(jsonify_insights_results(rows))
+    assert list(jsonify_insights_results(rows, JsonCache())) == expected
+
+
+def test_get_insights_memoize_json():
+    mock_logs_client = MagicMock()
+    mock_logs_client.start_query.return_value = {'queryId': 'fake-query-id'}
+    mock_logs_client.get_query_results.return_value = {
+        'status': ResponseStatus.COMPLETE,
+        'results': [[{'field': 'foo', 'value': '{"level": "INFO"}'}] for _ in range(3)]
+    }
+    insights = Insights(mock_logs_client)
+    for _ in range(2):
+        results = list(insights.get_insights(
+            'fields foo', result_limit=10, group_names=['/aws/lambda/a'], start_time=0, end_time=100,
+            memoize_json=True
+        ))
+        assert results == [{'foo': {'level': 'INFO'}}] * 3
+    # the cache is kept between queries
+    assert insights.json_cache.cache_info().misses == 1
+    assert insights.json_cache.cache_info().hits == 5
@@ -0,0 +1,168 @@
+"""Merging the results of many queries into one sorted stream, spilling to disk so memory stays bounded."""
+import heapq
+import mmap
+import os
+import pickle
+import re
+import struct
+import tempfile
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Generator
+
+GenericDict = Dict[str, Any]
+
+_LENGTH = struct.Struct('>I')
+
+_INT_RE = re.compile(r'-?\d+')
+_FLOAT_RE = re.compile(r'-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?')
+
+
+def _comparable(value: Any) -> Tuple[int, Any]:
+    """
+    Tags a value with its kind, so values of different types never get compared to each other: numbers (including
+    numeric strings, which would otherwise sort as text) first, then other strings, datetimes, and anything else by its
+    repr
+    """
+    if isinstance(value, (int, float)):
+        return 0, value
+    elif isinstance(value, str):
+        if _INT_RE.fullmatch(value):
+            return 0, int(value)
+        elif _FLOAT_RE.fullmatch(value):
+            return 0, float(value)
+        return 1, value
+    elif isinstance(value, datetime):
+        # naive and aware datetimes can't be compared, so neither can be mixed up with the other
+        return (2, value) if value.tzinfo is None else (3, value)
+    return 4, repr(value)
+
+
+def _write_run(path: str, rows: Iterable[GenericDict]) -> None:
+    # rows are pickled, rather than written as json, so typed values like datetimes survive the round trip
+    with open(path, 'wb') as fout:
+        for row in rows:
+            row_bytes = pickle.dumps(row, protocol=pickle.HIGHEST_PROTOCOL)
+            fout.write(_LENGTH.pack(len(row_bytes)))
+            fout.write(row_bytes)
+
+
+def _read_run(path: str) -> Generator[GenericDict, None, None]:
+    with open(path, 'rb') as fin, mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as run:
+        position = 0
+        while position < len(run):
+            (length,) = _LENGTH.unpack_from(run, position)
+            position += _LENGTH.size
+            yield pickle.loads(run[position:position + length])
+            position += length
+
+
+class ExternalMerger:
+    def __init__(self, sort_by: str, descending: bool = False, max_memory_rows: int = 100000,
+                 tmp_dir: Optional[str] = None, max_fan_in: int = 64):
+        """
+        Collects rows from any number of shards and gives them back sorted on the `sort_by` field.  Once more than
+        `max_memory_rows` rows are held, they're sorted and spilled to a temporary run file, and merged() streams the
+        runs back in a k-way merge, reading them through mmap.  So memory stays around `max_memory_rows` rows however
+        many rows there are.  If there are too many runs to open at once, they're first merged into fewer, bigger
+        runs, `max_fan_in` at a time.
+
+        Rows missing `sort_by` come last.  Values of different types are ordered by kind (see _comparable()), and
+        numeric strings sort as numbers.  add() can be called from several threads at once.
+
+        tmp_dir: Where run files are written.  Default: the system's temporary directory
+        max_fan_in: The most runs merged at once, each of which holds a file open.  At least 2.  Default: 64
+        """
+        if max_fan_in < 2:
+            raise ValueError(f"max_fan_in must be at least 2, not {max_fan_in}")
+        self.sort_by = sort_by
+        self.descending = descending
+        self.max_memory_rows = max_memory_rows
+        self.tmp_dir = tmp_dir
+        self.max_fan_in = max_fan_in
+        self._rows: List[GenericDict] = []
+        self._run_paths: List[str] = []
+        self._runs_written = 0
+        self._run_dir: Optional[tempfile.TemporaryDirectory] = None
+        self._lock = threading.Lock()
+
+    def _sort_key(self, row: GenericDict) -> Tuple[bool, Tuple[int, Any]]:
+        value = row.get(self.sort_by)
+        # missing values sort last either way
+        missing_last = value is not None if self.descending else value is None
+        return missing_last, _comparable(value) if value is not None else (0, 0)
+
+    def _new_run_path(self) -> str:
+        if self._run_dir is None:
+            self._run_dir = tempfile.TemporaryDirectory(prefix='acwi-merge-', dir=self.tmp_dir)
+        path = os.path.join(self._run_dir.name, f"run-{self._runs_written:06}")
+        self._runs_written += 1
+        return path
+
+    def _spill(self) -> None:
+        self._rows.sort(key=self._sort_key, reverse=self.descending)
+        path = self._new_run_path()
+        _write_run(path, self._rows)
+        self._run_paths.append(path)
+        self._rows = []
+
+    def _merge_runs(self, paths: List[str]) -> str:
+        """Merges the runs into a new one, removing them"""
+        path = self._new_run_path()
+        runs = [_read_run(run_path) for run_path in paths]
+        try:
+            _write_run(path, heapq.merge(*runs, key=self._sort_key, reverse=self.descending))
+        finally:
+            for run in runs:
+                run.close()
+        for run_path in paths:
+            os.remove(run_path)
+        return path
+
+    @property
+    def spilled_runs(self) -> int:
+        return len(self._run_paths)
+
+    def add(self, rows: Iterable[GenericDict]) -> None:
+        with self._lock:
+            for row in rows:
+                self._rows.append(row)
+                if len(self._rows) >= self.max_memory_rows:
+                    self._spill()
+
+    def merged(self) -> Iterator[GenericDict]:
+        """
+        The rows added so far, sorted.  Run files are removed once the iterator is exhausted or closed, so only call
+        this once
+        """
+        self._rows.sort(key=self._sort_key, reverse=self.descending)
+        in_memory_run, self._rows = self._rows, []
+        spilled_runs: List[Generator[GenericDict, None, None]] = []
+        try:
+            # the in-memory run takes up one place in the final merge
+            while len(self._run_paths) > self.max_fan_in - 1:
+                groups = [
+                    self._run_paths[i:i + self.max_fan_in] for i in range(0, len(self._run_paths), self.max_fan_in)
+                ]
+                self._run_paths = [self._merge_runs(group) if len(group) > 1 else group[0] for group in groups]
+            spilled_runs = [_read_run(path) for path in self._run_paths]
+            yield from heapq.merge(*spilled_runs, in_memory_run, key=self._sort_key, reverse=self.descending)
+        finally:
+            for spilled_run in spilled_runs:
+                spilled_run.close()
+            if self._run_dir is not None:
+                self._run_dir.cleanup()
+                self._run_dir = None
+            self._run_paths = []
+
+
+def external_merge(shards: Iterable[Iterable[GenericDict]], sort_by: str, descending: bool = False,
+                   max_memory_rows: int = 100000, tmp_dir: Optional[str] = None,
+                   max_fan_in: int = 64) -> Iterator[GenericDict]:
+    """Merges the rows of all the shards into one stream sorted on `sort_by`.  See ExternalMerger"""
+    merger = ExternalMerger(
+        sort_by, descending=descending, max_memory_rows=max_memory_rows, tmp_dir=tmp_dir, max_fan_in=max_fan_in
+    )
+    for shard in shards:
+        merger.add(shard)
+    return merger.merged()
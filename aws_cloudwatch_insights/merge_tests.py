@@ -0,0 +1,92 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from aws_cloudwatch_insights.aws_cloudwatch_insights import Insights
+from aws_cloudwatch_insights import merge
+from aws_cloudwatch_insights.merge import ExternalMerger, external_merge
+from aws_cloudwatch_insights.sweep_tests import FakeLogsClient, BINDINGS
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('max_memory_rows', [7, 1000])
+def test_external_merge(tmp_path, descending, max_memory_rows):
+    rng = random.Random(42)
+    shards = [[{'n': rng.randint(0, 50), 'shard': s} for _ in range(rng.randint(0, 30))] for s in range(6)]
+    shards[2].append({'shard': 2})
+    all_rows = [row for shard in shards for row in shard]
+
+    merged = list(external_merge(
+        shards, 'n', descending=descending, max_memory_rows=max_memory_rows, tmp_dir=str(tmp_path)
+    ))
+    assert sorted(map(repr, merged)) == sorted(map(repr, all_rows))
+    values = [row['n'] for row in merged[:-1]]
+    assert values == sorted(values, reverse=descending)
+    assert merged[-1] == {'shard': 2}, 'Missing values come last'
+    assert os.listdir(tmp_path) == [], 'Run files are cleaned up'
+
+
+@pytest.mark.parametrize('max_memory_rows', [2, 1000])
+def test_external_merge_mixed_types(tmp_path, max_memory_rows):
+    shards = [
+        [{'v': '10'}, {'v': 'b'}, {'v': 3}],
+        [{'v': '9.5'}, {'v': 'a'}, {'v': -1}, {'v': None}],
+    ]
+    merged = list(external_merge(shards, 'v', max_memory_rows=max_memory_rows, tmp_dir=str(tmp_path)))
+    assert [row['v'] for row in merged] == [-1, 3, '9.5', '10', 'a', 'b', None]
+
+
+def test_external_merger_spills(tmp_path):
+    merger = ExternalMerger('t', max_memory_rows=10, tmp_dir=str(tmp_path))
+    start = datetime(2023, 2, 20)
+    merger.add({'t': start + timedelta(minutes=i)} for i in range(0, 50, 2))
+    merger.add({'t': start + timedelta(minutes=i)} for i in range(1, 50, 2))
+    assert merger.spilled_runs == 5
+    assert merger.max_memory_rows > len(merger._rows)
+
+    merged = merger.merged()
+    assert next(merged) == {'t': start}, 'Typed values survive spilling'
+    merged.close()
+    assert os.listdir(tmp_path) == [], 'Run files are cleaned up when the iterator is closed early'
+
+
+def test_get_insights_sweep_sorted():
+    results = Insights(FakeLogsClient()).get_insights_sweep(
+        'fields requestId, message | filter requestId in ${id}', BINDINGS, result_limit=100,
+        group_names=['/aws/lambda/a'], start_time=0, end_time=100, max_pack=3, sort_by='requestId', descending=True,
+        max_memory_rows=4
+    )
+    assert [row['@binding'] for row in results] == sorted(BINDINGS, reverse=True)
+
+
+@pytest.mark.parametrize('max_fan_in', [2, 3, 64])
+def test_external_merger_max_fan_in(tmp_path, monkeypatch, max_fan_in):
+    open_runs = [0]
+    most_open_runs = [0]
+    read_run = merge._read_run
+
+    def _read_run(path):
+        open_runs[0] += 1
+        most_open_runs[0] = max(most_open_runs[0], open_runs[0])
+        try:
+            yield from read_run(path)
+        finally:
+            open_runs[0] -= 1
+
+    monkeypatch.setattr(merge, '_read_run', _read_run)
+    rng = random.Random(42)
+    rows = [{'n': rng.randint(0, 1000)} for _ in range(300)]
+    merger = ExternalMerger('n', max_memory_rows=2, tmp_dir=str(tmp_path), max_fan_in=max_fan_in)
+    merger.add(rows)
+    assert merger.spilled_runs == 150
+
+    assert [row['n'] for row in merger.merged()] == sorted(row['n'] for row in rows)
+    assert most_open_runs[0] == max_fan_in, 'No more than max_fan_in runs are open at once'
+    assert os.listdir(tmp_path) == [], 'Run files are cleaned up'
+
+
+def test_external_merger_max_fan_in_too_low():
+    with pytest.raises(ValueError):
+        ExternalMerger('n', max_fan_in=1)
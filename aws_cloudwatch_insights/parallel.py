@@ -0,0 +1,67 @@
+"""Post-processing whole batches of results on a pool of processes while the next batch is being queried."""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Any, Callable, Optional, Deque, Tuple
+
+
+class OrderedProcessPipeline:
+    def __init__(self, processes: Optional[int] = None, max_pending: Optional[int] = None):
+        """
+        Runs functions on a pool of processes and hands their results to callbacks in the parent, in the order they
+        were submitted.  Meant for whole batches, eg an export's windows: a batch is processed while the parent waits
+        on AWS for the next one, and its result should be cheap to send back (eg encoded bytes rather than dicts),
+        since unpickling it happens in the parent.  Use as a context manager.
+
+        processes: The size of the pool.  Default: one per CPU
+        max_pending: The most batches submitted but not yet handed to their callbacks, which bounds memory.  Default:
+          twice `processes`
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.processes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Deque[Tuple[Future, Callable[[Any], None]]] = deque()
+
+    def __enter__(self) -> 'OrderedProcessPipeline':
+        self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        assert self._executor is not None
+        self._executor.shutdown()
+        self._executor = None
+        self._pending.clear()
+
+    def _complete_oldest(self) -> None:
+        future, on_done = self._pending.popleft()
+        on_done(future.result())
+
+    def submit(self, on_done: Callable[[Any], None], func: Callable[..., Any], *args: Any) -> None:
+        """
+        Runs func(*args) in the pool, later calling on_done() with its result.  Blocks, completing the oldest batches,
+        while there are `max_pending` of them.  `func` and `args` have to be picklable: `func` should be a module level
+        function
+        """
+        assert self._executor is not None, 'OrderedProcessPipeline must be used as a context manager'
+        while len(self._pending) >= self.max_pending:
+            self._complete_oldest()
+        self._pending.append((self._executor.submit(func, *args), on_done))
+
+    def submit_inline(self, on_done: Callable[[Any], None], func: Callable[..., Any], *args: Any) -> None:
+        """
+        Like submit(), but runs func(*args) here, for batches too small to be worth sending to the pool.  on_done() is
+        still called in order, after the batches submitted before it
+        """
+        future: Future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        while len(self._pending) >= self.max_pending:
+            self._complete_oldest()
+        self._pending.append((future, on_done))
+
+    def drain(self) -> None:
+        """Waits for every submitted batch, handing each to its callback in order"""
+        while self._pending:
+            self._complete_oldest()
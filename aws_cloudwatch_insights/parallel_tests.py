@@ -0,0 +1,32 @@
+import os
+from typing import List, Tuple
+
+from aws_cloudwatch_insights.parallel import OrderedProcessPipeline
+
+
+def _square_with_pid(n: int) -> Tuple[int, int]:
+    return n * n, os.getpid()
+
+
+def test_ordered_process_pipeline():
+    done: List[Tuple[int, int]] = []
+    with OrderedProcessPipeline(processes=2, max_pending=3) as pipeline:
+        for n in range(10):
+            pipeline.submit(done.append, _square_with_pid, n)
+            assert len(done) >= n - 2, 'No more than `max_pending` batches are outstanding'
+        pipeline.drain()
+    assert [n for n, _ in done] == [n * n for n in range(10)], 'Results are handed back in order'
+    assert os.getpid() not in {pid for _, pid in done}
+
+
+def test_ordered_process_pipeline_inline():
+    done: List[Tuple[int, int]] = []
+    with OrderedProcessPipeline(processes=2) as pipeline:
+        for n in range(10):
+            if n % 3 == 0:
+                pipeline.submit_inline(done.append, _square_with_pid, n)
+            else:
+                pipeline.submit(done.append, _square_with_pid, n)
+        pipeline.drain()
+    assert [n for n, _ in done] == [n * n for n in range(10)], 'Inline results are handed back in order too'
+    assert [pid == os.getpid() for _, pid in done] == [n % 3 == 0 for n in range(10)]
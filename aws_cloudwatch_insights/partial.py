@@ -0,0 +1,38 @@
+"""Results of queries that were stopped before they completed."""
+from typing import Dict, Any, Iterable, Iterator
+
+# not imported from aws_cloudwatch_insights.py, which imports this module
+GenericDict = Dict[str, Any]
+
+
+class PartialReason:
+    DEADLINE = 'deadline'
+    LIMIT = 'limit'
+
+
+class PartialResults(list):
+    """The results of a query that was stopped before it completed.  `reason` is one of the PartialReason values"""
+    partial = True
+
+    def __init__(self, results: Iterable[GenericDict], reason: str):
+        super().__init__(results)
+        self.reason = reason
+
+
+class PartialIterator(Iterator[GenericDict]):
+    """
+    Like PartialResults, for results that are streamed rather than returned as a list, eg the rows of a sorted sweep
+    """
+    partial = True
+
+    def __init__(self, results: Iterator[GenericDict], reason: str):
+        self._results = results
+        self.reason = reason
+
+    def __next__(self) -> GenericDict:
+        return next(self._results)
+
+    def close(self) -> None:
+        close = getattr(self._results, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,94 @@
+"""Query templates with a `${name}` placeholder, run per binding or with bindings packed into `in [...]` filters."""
+import json
+import re
+from typing import List, Any, Optional, Dict
+
+GenericDict = Dict[str, Any]
+
+# AWS's limit on the length of a query string
+MAX_QUERY_LENGTH = 10000
+# AWS's limit on the rows a query returns
+MAX_RESULT_LIMIT = 10000
+
+_PLACEHOLDER_RE = re.compile(r'\$\{(\w+)\}')
+
+
+class SweepMode:
+    AUTO = 'auto'
+    PACK = 'pack'
+    FANOUT = 'fanout'
+
+
+class SweepTemplateException(Exception):
+    pass
+
+
+def template_placeholder(template: str) -> str:
+    """The name of the template's placeholder.  Templates have exactly one, though it can be used more than once"""
+    names = set(_PLACEHOLDER_RE.findall(template))
+    if len(names) != 1:
+        raise SweepTemplateException(f"Query templates need exactly one ${{name}} placeholder, found {sorted(names)!r}")
+    return names.pop()
+
+
+def packed_field(template: str, name: str) -> Optional[str]:
+    """If the placeholder is only used as `field in ${name}`, the field, otherwise None"""
+    in_filters = re.findall(r'([@\w.]+)\s+in\s*\$\{' + re.escape(name) + r'\}', template)
+    if len(in_filters) != len(_PLACEHOLDER_RE.findall(template)):
+        return None
+    return in_filters[0] if len(set(in_filters)) == 1 else None
+
+
+def format_literal(value: Any) -> str:
+    """Formats a binding as an Insights literal: numbers as they are, everything else as a quoted string"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return json.dumps(str(value))
+
+
+def render(template: str, name: str, value: Any) -> str:
+    return template.replace(f"${{{name}}}", format_literal(value))
+
+
+def render_packed(template: str, name: str, values: List[Any]) -> str:
+    return template.replace(f"${{{name}}}", '[' + ', '.join(format_literal(v) for v in values) + ']')
+
+
+def pack_bindings(template: str, name: str, bindings: List[Any], max_pack: int,
+                  max_query_length: int = MAX_QUERY_LENGTH) -> List[List[Any]]:
+    """Splits the bindings into batches small enough that each rendered query fits AWS's limits"""
+    placeholder = f"${{{name}}}"
+    uses = template.count(placeholder)
+    base_length = len(template) - uses * len(placeholder)
+
+    def _query_length(literals_length: int, count: int) -> int:
+        # each use renders as `[a, b, c]`
+        return base_length + uses * (2 + literals_length + 2 * (count - 1))
+
+    batches: List[List[Any]] = []
+    batch: List[Any] = []
+    literals_length = 0
+    for binding in bindings:
+        literal_length = len(format_literal(binding))
+        if _query_length(literal_length, 1) > max_query_length:
+            raise SweepTemplateException(f"Query is too long even with just the binding {binding!r}")
+        if batch and (
+            len(batch) >= max_pack or _query_length(literals_length + literal_length, len(batch) + 1) > max_query_length
+        ):
+            batches.append(batch)
+            batch = []
+            literals_length = 0
+        batch.append(binding)
+        literals_length += literal_length
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def find_binding(row: GenericDict, field: str, bindings: List[Any]) -> Any:
+    """Which of a packed query's bindings a row matched, from its `field`.  None if the row doesn't have the field"""
+    by_str = {str(b): b for b in bindings}
+    value = row.get(field)
+    if value is not None and str(value) in by_str:
+        return by_str[str(value)]
+    return None
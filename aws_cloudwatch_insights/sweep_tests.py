@@ -0,0 +1,196 @@
+import json
+import re
+import threading
+from typing import List, Dict
+from unittest.mock import MagicMock
+
+import pytest
+
+from aws_cloudwatch_insights.aws_cloudwatch_insights import Insights, ResponseStatus
+from aws_cloudwatch_insights.partial import PartialResults, PartialIterator, PartialReason
+from aws_cloudwatch_insights.sweep import template_placeholder, packed_field, pack_bindings, render, render_packed, \
+    find_binding, SweepTemplateException, SweepMode
+
+
+@pytest.mark.parametrize('template,expected', [
+    ('filter requestId = ${id}', 'id'),
+    ('filter requestId = ${id} or parentId = ${id}', 'id'),
+])
+def test_template_placeholder(template, expected):
+    assert template_placeholder(template) == expected
+
+
+@pytest.mark.parametrize('template', ['fields @message', 'filter a = ${a} and b = ${b}'])
+def test_template_placeholder_invalid(template):
+    with pytest.raises(SweepTemplateException):
+        template_placeholder(template)
+
+
+@pytest.mark.parametrize('template,expected', [
+    ('fields @message | filter requestId in ${id}', 'requestId'),
+    ('filter @requestId in ${id} | stats count(*) by @requestId', '@requestId'),
+    ('filter requestId = ${id}', None),
+    ('filter requestId in ${id} or parentId = ${id}', None),
+    ('filter requestId in ${id} or parentId in ${id}', None),
+])
+def test_packed_field(template, expected):
+    assert packed_field(template, 'id') == expected
+
+
+def test_render():
+    assert render('filter a = ${v}', 'v', 'x"y') == 'filter a = "x\\"y"'
+    assert render('filter a = ${v}', 'v', 12) == 'filter a = 12'
+    assert render_packed('filter a in ${v}', 'v', ['x', 2]) == 'filter a in ["x", 2]'
+
+
+def test_pack_bindings():
+    template = 'filter a in ${v}'
+    assert pack_bindings(template, 'v', list(range(7)), max_pack=3) == [[0, 1, 2], [3, 4, 5], [6]]
+
+    bindings = [f"binding-{i:04}" for i in range(100)]
+    max_query_length = 200
+    batches = pack_bindings(template, 'v', bindings, max_pack=100, max_query_length=max_query_length)
+    assert [b for batch in batches for b in batch] == bindings
+    assert len(batches) > 1
+    for batch in batches:
+        assert len(render_packed(template, 'v', batch)) <= max_query_length
+    # each batch is as big as it can be
+    for batch, next_batch in zip(batches, batches[1:]):
+        assert len(render_packed(template, 'v', [*batch, next_batch[0]])) > max_query_length
+
+    with pytest.raises(SweepTemplateException):
+        pack_bindings(template, 'v', ['x' * 300], max_pack=100, max_query_length=max_query_length)
+
+
+def test_find_binding():
+    bindings = ['a', 'b', 3]
+    assert find_binding({'requestId': 'b'}, 'requestId', bindings) == 'b'
+    assert find_binding({'requestId': '3'}, 'requestId', bindings) == 3
+    assert find_binding({'count': 5, 'other': 'a'}, 'requestId', bindings) is None, "Other fields aren't guessed at"
+    assert find_binding({'requestId': 'c'}, 'requestId', bindings) is None
+
+
+class FakeLogsClient:
+    """Answers each query with a row per quoted value in it, as though that value was found in `requestId`"""
+    def __init__(self):
+        self.queries: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.stop_query = MagicMock()
+
+    def start_query(self, queryString, **_):
+        with self._lock:
+            query_id = f"query-{len(self.queries)}"
+            self.queries[query_id] = queryString
+        return {'queryId': query_id}
+
+    def get_query_results(self, queryId):
+        values: List[str] = [json.loads(v) for v in re.findall(r'"[^"]*"', self.queries[queryId])]
+        return {
+            'status': ResponseStatus.COMPLETE,
+            'results': [
+                [{'field': 'requestId', 'value': v}, {'field': 'message', 'value': f"found {v}"}] for v in values
+            ],
+            'statistics': {'bytesScanned': 0.0}
+        }
+
+
+BINDINGS = [f"id-{i}" for i in range(10)]
+EXPECTED_ROWS = [{'requestId': b, 'message': f"found {b}", '@binding': b} for b in BINDINGS]
+
+
+@pytest.mark.parametrize('template,mode,expected_query_count', [
+    ('fields requestId, message | filter requestId in ${id}', SweepMode.AUTO, 3),
+    ('fields requestId, message | filter requestId in ${id}', SweepMode.PACK, 3),
+    ('fields requestId, message | filter requestId in ${id}', SweepMode.FANOUT, 10),
+    ('fields requestId, message | filter requestId = ${id}', SweepMode.AUTO, 10),
+])
+def test_get_insights_sweep(template, mode, expected_query_count):
+    logs_client = FakeLogsClient()
+    results = Insights(logs_client).get_insights_sweep(
+        template, BINDINGS, result_limit=100, group_names=['/aws/lambda/a'], start_time=0, end_time=100, mode=mode,
+        max_pack=4
+    )
+    assert len(logs_client.queries) == expected_query_count
+    assert results == EXPECTED_ROWS
+
+
+def test_get_insights_sweep_pack_needs_in_filter():
+    with pytest.raises(SweepTemplateException):
+        Insights(FakeLogsClient()).get_insights_sweep(
+            'filter requestId = ${id}', BINDINGS, result_limit=100, group_names=['/aws/lambda/a'], start_time=0,
+            mode=SweepMode.PACK
+        )
+
+
+@pytest.mark.parametrize('result_limit,expected_limits', [
+    (5, [20, 20, 10]),
+    (4000, [8000, 8000, 8000, 8000, 8000]),
+])
+def test_get_insights_sweep_pack_limit(result_limit, expected_limits):
+    logs_client = FakeLogsClient()
+    limits = []
+    start_query = logs_client.start_query
+
+    def _start_query(limit, **kwargs):
+        limits.append(limit)
+        return start_query(**kwargs)
+
+    logs_client.start_query = _start_query
+    Insights(logs_client).get_insights_sweep(
+        'fields requestId | filter requestId in ${id}', BINDINGS, result_limit=result_limit,
+        group_names=['/aws/lambda/a'], start_time=0, end_time=100, max_pack=4, concurrency=1
+    )
+    assert limits == expected_limits, 'Each binding gets `result_limit` rows, up to the 10000 rows AWS allows'
+
+
+class RunningFakeLogsClient(FakeLogsClient):
+    """Like FakeLogsClient, but the queries are still running when their rows come back"""
+    def get_query_results(self, queryId):
+        return {**super().get_query_results(queryId), 'status': ResponseStatus.RUNNING}
+
+
+@pytest.mark.parametrize('sort_by,expected_type', [(None, PartialResults), ('requestId', PartialIterator)])
+def test_get_insights_sweep_partial(sort_by, expected_type):
+    logs_client = RunningFakeLogsClient()
+    results = Insights(logs_client).get_insights_sweep(
+        'fields requestId, message | filter requestId = ${id}', BINDINGS, result_limit=1,
+        group_names=['/aws/lambda/a'], start_time=0, end_time=100, sort_by=sort_by, stop_at_limit=True
+    )
+    assert isinstance(results, expected_type)
+    assert results.reason == PartialReason.LIMIT
+    assert list(results) == EXPECTED_ROWS
+    assert logs_client.stop_query.call_count == len(BINDINGS)
+
+
+class NoisyFakeLogsClient(FakeLogsClient):
+    """Like FakeLogsClient, but finds `noise` rows for `id-0`, and returns no more than the query's limit"""
+    def __init__(self, noise: int):
+        super().__init__()
+        self.noise = noise
+        self.limits: Dict[str, int] = {}
+
+    def start_query(self, limit, **kwargs):
+        response = super().start_query(**kwargs)
+        self.limits[response['queryId']] = limit
+        return response
+
+    def get_query_results(self, queryId):
+        response = super().get_query_results(queryId)
+        results = [r for row in response['results'] for r in [row] * (self.noise if row[0]['value'] == 'id-0' else 1)]
+        return {**response, 'results': results[:self.limits[queryId]]}
+
+
+@pytest.mark.parametrize('noise,expected_query_count', [
+    # the first batch's query is filled by id-0, so its bindings are run again a query each
+    (50, 3 + 4),
+    # it isn't, but id-0 still only gets as many rows as a query of its own would
+    (7, 3),
+])
+def test_get_insights_sweep_pack_noisy_binding(noise, expected_query_count):
+    logs_client = NoisyFakeLogsClient(noise)
+    results = Insights(logs_client).get_insights_sweep(
+        'fields requestId, message | filter requestId in ${id}', BINDINGS, result_limit=5,
+        group_names=['/aws/lambda/a'], start_time=0, end_time=100, max_pack=4, concurrency=1
+    )
+    assert len(logs_client.queries) == expected_query_count
+    assert results == [EXPECTED_ROWS[0]] * 5 + EXPECTED_ROWS[1:]
@@ -0,0 +1,140 @@
+"""Converting the string values Insights returns into native types, a column at a time."""
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Iterable, Optional, Any, Callable
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    # numpy just makes things faster, it isn't required
+    np = None  # type: ignore
+
+# not imported from aws_cloudwatch_insights.py, which imports this module
+GenericDict = Dict[str, Any]
+
+
+class FieldType:
+    TIMESTAMP = 'timestamp'  # int milliseconds since the epoch
+    DATETIME = 'datetime'  # timezone-aware UTC datetime
+    INT = 'int'
+    FLOAT = 'float'
+    STRING = 'str'
+
+
+Schema = Dict[str, str]
+
+_FIELD_TYPES = {FieldType.TIMESTAMP, FieldType.DATETIME, FieldType.INT, FieldType.FLOAT, FieldType.STRING}
+
+TIMESTAMP_FIELDS = {'@timestamp', '@ingestionTime'}
+
+# no leading zeros, since values like zip codes or account ids lose them as numbers; those need an explicit schema
+_INT_RE = re.compile(r'-?(0|[1-9]\d*)')
+_FLOAT_RE = re.compile(r'-?((0|[1-9]\d*)(\.\d*)?|\.\d+)([eE][-+]?\d+)?')
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_MS = timedelta(milliseconds=1)
+
+
+def infer_schema(rows: List[GenericDict]) -> Schema:
+    """
+    Guesses each field's type: `@timestamp` and `@ingestionTime` are timestamps, fields whose values all look like
+    integers or floats are numbers, and everything else is left as a string
+    """
+    columns: Dict[str, List[Any]] = {}
+    for row in rows:
+        for key, value in row.items():
+            columns.setdefault(key, []).append(value)
+
+    return {key: infer_field_type(key, values) for key, values in columns.items()}
+
+
+def infer_field_type(key: str, values: List[Any]) -> str:
+    """Guesses the type of a single column, ignoring missing values"""
+    present = [v for v in values if v is not None]
+    if key in TIMESTAMP_FIELDS:
+        return FieldType.TIMESTAMP
+    elif not present or not all(isinstance(v, str) for v in present):
+        return FieldType.STRING
+    elif all(_INT_RE.fullmatch(v) for v in present):
+        return FieldType.INT
+    elif all(_FLOAT_RE.fullmatch(v) for v in present):
+        return FieldType.FLOAT
+    else:
+        return FieldType.STRING
+
+
+def _to_timestamp(value: str) -> int:
+    # Insights returns timestamps like '2023-02-20 14:56:40.123', in UTC
+    return (datetime.fromisoformat(value) - _EPOCH) // _ONE_MS
+
+
+def _from_timestamp(value: int) -> datetime:
+    return _EPOCH_UTC + value * _ONE_MS
+
+
+def _convert_each(values: List[Any], convert: Callable[[Any], Any]) -> List[Any]:
+    """Converts value by value, leaving alone anything that can't be converted"""
+    converted = []
+    for value in values:
+        try:
+            converted.append(convert(value))
+        except (ValueError, TypeError):
+            converted.append(value)
+    return converted
+
+
+def convert_column(values: List[Any], field_type: str) -> List[Any]:
+    """Converts a list of values to `field_type`, returning a new list.  Values which can't be converted are kept"""
+    if field_type not in _FIELD_TYPES:
+        raise ValueError(f"Unknown field type: {field_type!r}")
+    if field_type == FieldType.STRING:
+        return values
+    if np is not None:
+        dtype: Any = {
+            FieldType.TIMESTAMP: 'datetime64[ms]',
+            FieldType.DATETIME: 'datetime64[ms]',
+            FieldType.INT: np.int64,
+            FieldType.FLOAT: np.float64,
+        }[field_type]
+        try:
+            array = np.array(values).astype(dtype)
+            if field_type in {FieldType.TIMESTAMP, FieldType.DATETIME}:
+                array = array.astype(np.int64)
+            converted = array.tolist()
+            if field_type == FieldType.DATETIME:
+                converted = [_from_timestamp(v) for v in converted]
+            return converted
+        except (ValueError, TypeError, OverflowError):
+            # some value numpy can't handle, so go through them one at a time
+            pass
+
+    if field_type == FieldType.TIMESTAMP:
+        return _convert_each(values, _to_timestamp)
+    elif field_type == FieldType.DATETIME:
+        return _convert_each(values, lambda v: _from_timestamp(_to_timestamp(v)))
+    elif field_type == FieldType.INT:
+        return _convert_each(values, int)
+    else:
+        return _convert_each(values, float)
+
+
+def decode_typed_results(results: Iterable[GenericDict], schema: Optional[Schema] = None) -> List[GenericDict]:
+    """
+    Converts fields to native types a whole column at a time, using numpy if it's installed.
+
+    schema: A dict of field name to one of the FieldType values.  Only the fields in it are converted.  If None, the
+      schema is inferred with infer_schema()
+
+    Values which can't be converted are left as they are.  The rows are updated in place
+    """
+    rows = list(results)
+    if schema is None:
+        schema = infer_schema(rows)
+
+    for key, field_type in schema.items():
+        indexes = [i for i, row in enumerate(rows) if row.get(key) is not None]
+        converted = convert_column([rows[i][key] for i in indexes], field_type)
+        for i, value in zip(indexes, converted):
+            rows[i][key] = value
+
+    return rows
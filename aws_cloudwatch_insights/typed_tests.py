@@ -0,0 +1,70 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from aws_cloudwatch_insights import typed
+from aws_cloudwatch_insights.typed import FieldType, infer_schema, infer_field_type, decode_typed_results
+
+
+@pytest.fixture(params=[True, False], ids=['numpy', 'no-numpy'])
+def with_numpy(request, monkeypatch) -> bool:
+    if request.param:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(typed, 'np', None)
+    return request.param
+
+
+def _rows():
+    return [
+        {'@timestamp': '2023-02-20 14:56:40.123', 'count': '3', 'avg': '1.5', 'level': 'INFO', 'body': {'a': 1}},
+        {'@timestamp': '2023-02-20 14:56:41.000', 'count': '-10', 'avg': '2', 'level': 'ERROR'},
+    ]
+
+
+def test_infer_schema():
+    assert infer_schema(_rows()) == {
+        '@timestamp': FieldType.TIMESTAMP,
+        'count': FieldType.INT,
+        'avg': FieldType.FLOAT,
+        'level': FieldType.STRING,
+        'body': FieldType.STRING,
+    }
+
+
+@pytest.mark.parametrize('values,expected', [
+    (['0', '-12', '340'], FieldType.INT),
+    (['0.5', '-0', '1e3', '.25', '12.'], FieldType.FLOAT),
+    (['012345678901', '12'], FieldType.STRING),
+    (['00.5'], FieldType.STRING),
+    (['-07'], FieldType.STRING),
+])
+def test_infer_field_type_leading_zeros(values, expected):
+    assert infer_field_type('field', values) == expected
+
+
+def test_decode_typed_results(with_numpy):
+    assert decode_typed_results(_rows()) == [
+        {'@timestamp': 1676905000123, 'count': 3, 'avg': 1.5, 'level': 'INFO', 'body': {'a': 1}},
+        {'@timestamp': 1676905001000, 'count': -10, 'avg': 2.0, 'level': 'ERROR'},
+    ]
+
+
+def test_decode_typed_results_schema(with_numpy):
+    actual = decode_typed_results(_rows(), schema={'@timestamp': FieldType.DATETIME, 'avg': FieldType.FLOAT})
+    assert actual[0]['@timestamp'] == datetime(2023, 2, 20, 14, 56, 40, 123000, tzinfo=timezone.utc)
+    assert actual[1]['@timestamp'] == datetime(2023, 2, 20, 14, 56, 41, tzinfo=timezone.utc)
+    assert [r['avg'] for r in actual] == [1.5, 2.0]
+    assert [r['count'] for r in actual] == ['3', '-10']
+
+
+def test_decode_typed_results_unconvertible(with_numpy):
+    rows = [{'count': '1'}, {'count': 'lots'}, {'other': 'x'}]
+    assert decode_typed_results(rows, schema={'count': FieldType.INT}) == [
+        {'count': 1}, {'count': 'lots'}, {'other': 'x'}
+    ]
+
+
+def test_decode_typed_results_unknown_type():
+    with pytest.raises(ValueError):
+        decode_typed_results([{'count': '1'}], schema={'count': 'bignum'})
@@ -11,8 +11,8 @@ with open('version.txt', 'r') as version_file:
     version = version.strip()
 
 requirements = [
-    'boto3>=1.21.40,<2.0.0',
-    'botocore>=1.21.40,<2.0.0'
+    'boto3>=1.24.84,<2.0.0',
+    'botocore>=1.27.84,<2.0.0'
 ]
 
 cli_requirements = [
@@ -21,6 +21,22 @@ cli_requirements = [
     'PyYAML>=6.0.0,<7.0.0'
 ]
 
+numpy_requirements = [
+    'numpy>=1.17.0,<3.0.0'
+]
+
+pandas_requirements = [
+    'pandas>=1.0.0,<4.0.0'
+]
+
+polars_requirements = [
+    'polars>=0.20.0,<3.0.0'
+]
+
+opentelemetry_requirements = [
+    'opentelemetry-api>=1.0.0,<2.0.0'
+]
+
 test_requirements = [
     'pytest>=7.0.0,<8.0.0',
     'freezegun>=1.2.2,<2.0.0',
@@ -70,6 +86,10 @@ setup(
     install_requires=requirements,
     extras_require={
         'cli': cli_requirements,
+        'numpy': numpy_requirements,
+        'pandas': pandas_requirements,
+        'polars': polars_requirements,
+        'opentelemetry': opentelemetry_requirements,
         'test': test_requirements,
         'lint': lint_requirements,
         'types': types_requirements